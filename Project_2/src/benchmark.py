@@ -0,0 +1,453 @@
+"""!@package docstring
+    Project name: Calculator
+    File: benchmark.py
+    Date: 18.10.2026
+    Last change: 18.10.2026
+    Authors: Jan Juda, Radek Duchoň, Markéta Nedělová
+    Licence: GNU GPLv2
+
+    Description: This file contains benchmarks of mathematical library.
+
+
+    @file benchmark.py
+
+    @brief This file contains benchmarks of mathematical library.
+    @authors Jan Juda, Radek Duchoň, Markéta Nedělová
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from generate_input_for_profiling import generateNumbers
+from mathlib import MathLib as m
+
+"""! Largest exponent of size of each case of the suite, factorial of 10 ^ 7 takes tens of minutes """
+SUITE_LIMITS = {'fact': 6}
+
+
+def measure(function, *args):
+    """! Measures wall time of one function call
+    @param function measured function
+    @param args arguments of the function
+    @return wall time in seconds
+    """
+
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def naiveFact(n):
+    """! Original factorial multiplying one number at a time, used as a baseline
+    @param n natural number for factorial
+    @return factorial of n
+    """
+
+    result = 1
+    for i in range(2, n + 1):
+        result *= i
+
+    return result
+
+
+def benchFact(sizes, naiveLimit=10 ** 5):
+    """! Benchmarks MathLib.fact computed from scratch and continued from memoized smaller factorial
+    @param sizes list of numbers for factorial
+    @param naiveLimit the baseline is measured only up to this number, it is quadratic
+    @return list of dicts with measured times in seconds
+    """
+
+    records = []
+    budget = m.fact_memo_budget
+    try:
+        for n in sizes:
+            m.fact_memo.clear()
+            m.fact_memo_budget = budget
+            record = {'n': n, 'cold': measure(m.fact, n)}
+            m.fact_memo.clear()
+            # The smaller factorial is memoized even when it exceeds the budget
+            m.fact_memo_budget = float('inf')
+            m.fact(n - n // 10)
+            record['memo'] = measure(m.fact, n)
+            record['naive'] = measure(naiveFact, n) if n <= naiveLimit else None
+            records.append(record)
+    finally:
+        m.fact_memo_budget = budget
+        m.fact_memo.clear()
+
+    return records
+
+
+def legacyParse(equation):
+    """! Original parser of members separated by space, used as a baseline
+    @param equation string with math problem
+    @return postfix notation of equation in list
+    """
+
+    s = []
+    postfix = []
+    for x in equation.split():
+        if x == ')':
+            while s[-1] != '(':
+                postfix.append(s.pop())
+            s.pop()
+        elif x == '(':
+            s.append('(')
+        elif x not in m.operands.keys():
+            postfix.append(float(x))
+        else:
+            while not (not len(s) or s[-1] == '(' or m.operands[s[-1]] < m.operands[x]):
+                postfix.append(s.pop())
+            s.append(x)
+
+    while len(s):
+        postfix.append(s.pop())
+
+    return postfix
+
+
+def randomEquation(tokens, seed=0, operators="+-*/"):
+    """! Generates long math problem with numbers, basic operators and brackets
+    @param tokens approximate number of tokens
+    @param seed seed of random generator
+    @param operators operators joining the numbers
+    @return list of members of the math problem
+    """
+
+    generator = random.Random(seed)
+    members = []
+    while len(members) < tokens:
+        if generator.random() < 0.1:
+            members += ["(", str(generator.randint(1, 999)), generator.choice("+-*"), "%.3f" % generator.random(), ")"]
+        else:
+            members.append("%.3f" % generator.uniform(1, 1000))
+        members.append(generator.choice(operators))
+    members.append("1")
+
+    return members
+
+
+def legacyTokenize(equation):
+    """! Tokenization of the original parser - split by space and float of every number, used as a baseline
+    @param equation string with math problem
+    @return list of numbers and operators
+    """
+
+    tokens = []
+    for x in equation.split():
+        tokens.append(x if x in m.operands or x == '(' or x == ')' else float(x))
+
+    return tokens
+
+
+def benchLexer(tokens, repeat=3):
+    """! Benchmarks tokenization and parsing of members separated by space and without spaces against the original
+    split and float path
+    @param tokens approximate number of tokens
+    @param repeat the best of repeated measurements is taken
+    @return dict with tokens per second of each tokenizer and parser
+    """
+
+    members = randomEquation(tokens)
+    spaced = " ".join(members)
+    tight = "".join(members)
+    assert legacyParse(spaced) == m.parse(spaced) == m.parse(tight)
+
+    def throughput(function, equation):
+        return len(members) / min(measure(function, equation) for _ in range(repeat))
+
+    return {'tokens': len(members),
+            'lex legacy': throughput(legacyTokenize, spaced),
+            'lex spaced': throughput(m.tokenize, spaced),
+            'lex tight': throughput(m.tokenize, tight),
+            'parse legacy': throughput(legacyParse, spaced),
+            'parse spaced': throughput(m.parse, spaced),
+            'parse tight': throughput(m.parse, tight)}
+
+
+def legacySolve(postfix):
+    """! Evaluation loop of the original solve - operator lookup and if/elif chain for every token, used as a baseline
+    @param postfix postfix notation of math problem
+    @return result of math problem
+    """
+
+    s = [0.0]
+    for x in postfix:
+        if x not in m.operands:
+            s.append(x)
+        else:
+            b = s.pop()
+            if x == '+':
+                s.append(m.add(s.pop(), b))
+            elif x == '-':
+                s.append(m.sub(s.pop(), b))
+            elif x == '*':
+                s.append(m.mul(s.pop(), b))
+            elif x == '/':
+                s.append(m.div(s.pop(), b))
+            elif x == '%':
+                s.append(m.mod(s.pop(), b))
+            elif x == '√':
+                s.append(m.root(s.pop(), b))
+            elif x == '^':
+                s.append(m.pow(s.pop(), b))
+            elif x == '!':
+                s.append(m.fact(b))
+            else:
+                raise ValueError("Exception")
+
+    return s[-1]
+
+
+def benchSolve(tokens, repeat=3):
+    """! Benchmarks evaluation of compiled bytecode against the original evaluation loop
+    The program is not optimized, so both evaluate the same number of tokens. Only additive operators are used,
+    long random products overflow.
+    @param tokens approximate number of tokens
+    @param repeat the best of repeated measurements is taken
+    @return dict with tokens per second of both evaluations and bytes of both program representations
+    """
+
+    equation = " ".join(randomEquation(tokens, operators="+-"))
+    postfix = m.parse(equation)
+    program = m.compile(equation, optimize=False)
+    assert legacySolve(postfix) == program.run()
+
+    def throughput(function, *args):
+        return len(postfix) / min(measure(function, *args) for _ in range(repeat))
+
+    return {'tokens': len(postfix),
+            'legacy': throughput(legacySolve, postfix),
+            'bytecode': throughput(program.run),
+            'legacy bytes': sys.getsizeof(postfix) + sum(sys.getsizeof(x) for x in postfix if type(x) is float),
+            'bytecode bytes': sum(sys.getsizeof(x) for x in (program.opcodes, program.args, program.floats))}
+
+
+def benchBackends(n, repeat=3):
+    """! Benchmarks numeric backends on a sum of decimal numbers, a product of integers and a factorial
+    @param n number of members of the sum and the product
+    @param repeat the best of repeated measurements is taken
+    @return dict of backend name and dict of workload and wall time in seconds
+    """
+
+    generator = random.Random(0)
+    workloads = {'sum': " + ".join("%.3f" % generator.uniform(0, 1000) for _ in range(n)),
+                 'product': " * ".join(str(generator.randint(1, 1000)) for _ in range(n)),
+                 'factorial': "%d ! / %d !" % (n, n - 1)}
+
+    def solve(equation, backend):
+        # Compile from scratch, not from the cache of compiled programs
+        m.cache.clear()
+        m.fact_memo.clear()
+        try:
+            m.solve(equation, backend)
+        except OverflowError:
+            # Product does not fit into float
+            pass
+
+    return {backend: {name: min(measure(solve, equation, backend) for _ in range(repeat))
+                      for name, equation in workloads.items()}
+            for backend in m.backends}
+
+
+def fixture(directory, n):
+    """! Returns file with n random values, it is generated only once
+    @param directory directory with fixtures
+    @param n number of values
+    @return path to the file
+    """
+
+    path = os.path.join(directory, "input%d.txt" % n)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        generateNumbers(path + ".tmp", n)
+        os.replace(path + ".tmp", path)
+
+    return path
+
+
+def measurePeak(function, *args):
+    """! Measures peak memory allocated by Python during one function call
+    @param function measured function
+    @param args arguments of the function
+    @return peak of traced memory in bytes
+    """
+
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def runScript(arguments, stdin=None):
+    """! Runs Python script in a child process
+    @param arguments script and its arguments
+    @param stdin path to file used as standard input
+    @return pair of wall time in seconds and peak resident memory of the child in bytes
+    """
+
+    with open(stdin or os.devnull, "rb") as f:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable] + arguments, stdin=f, stdout=subprocess.DEVNULL)
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, arguments)
+
+    # Linux reports kilobytes
+    return seconds, usage.ru_maxrss * 1024
+
+
+def suiteCases(path, n):
+    """! Creates cases of the suite for one size
+    @param path file with n random values
+    @param n size of the case
+    @return dict of case name and pair of function and its arguments measured in this process, or None for scripts
+    """
+
+    with open(path) as f:
+        values = [float(x) for x in f.read().split()]
+    equation = " + ".join("%r" % x for x in values)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "deviation.py")
+
+    def powers():
+        for x in values:
+            m.pow(x, 3)
+
+    def roots():
+        for x in values:
+            m.root(x, 3)
+
+    def solve():
+        # Solve from scratch, not from the cache of compiled programs
+        m.cache.clear()
+        m.solve(equation)
+
+    def fact():
+        m.fact_memo.clear()
+        m.fact(n)
+
+    return {'parse': (m.parse, equation),
+            'solve': (solve,),
+            'fact': (fact,),
+            'pow': (powers,),
+            'root': (roots,),
+            'deviation': (runScript, [script], path),
+            'deviation file': (runScript, [script, path])}
+
+
+def runSuite(maxExponent=7, directory=None, repeat=3, report=None):
+    """! Runs benchmark suite of MathLib and deviation.py on sizes from 10 to 10 ^ maxExponent
+    Wall time is the best of repeated runs, peak memory is measured in one more run, because tracing slows it down.
+    Memory of scripts is resident memory of the child process, memory of MathLib is memory allocated by Python.
+    @param maxExponent largest size is 10 ^ maxExponent
+    @param directory directory with fixtures, temporary by default
+    @param repeat number of measurements of wall time
+    @param report function called with each record when it is measured
+    @return list of records, dicts with case, size, seconds, throughput in inputs per second and peak bytes
+    """
+
+    with tempfile.TemporaryDirectory() as temporary:
+        records = []
+        for exponent in range(1, maxExponent + 1):
+            n = 10 ** exponent
+            path = fixture(directory or temporary, n)
+            for case, (function, *args) in suiteCases(path, n).items():
+                if exponent > SUITE_LIMITS.get(case, maxExponent):
+                    continue
+                if function is runScript:
+                    seconds, peak = min(runScript(*args) for _ in range(repeat))
+                else:
+                    seconds = min(measure(function, *args) for _ in range(repeat))
+                    peak = measurePeak(function, *args)
+                records.append({'case': case, 'size': n, 'seconds': seconds, 'throughput': n / seconds,
+                                'peak bytes': peak})
+                if report is not None:
+                    report(records[-1])
+
+    return records
+
+
+def compareRuns(base, new, threshold=0.1):
+    """! Compares two runs of the suite
+    @param base dict loaded from JSON of the base run
+    @param new dict loaded from JSON of the new run
+    @param threshold relative increase of wall time or peak memory reported as regression
+    @return list of (case, size, metric, base value, new value, regression) tuples of cases measured in both runs
+    """
+
+    baseRecords = {(r['case'], r['size']): r for r in base['records']}
+    rows = []
+    for r in new['records']:
+        b = baseRecords.get((r['case'], r['size']))
+        if b is None:
+            continue
+        for metric in ('seconds', 'peak bytes'):
+            rows.append((r['case'], r['size'], metric, b[metric], r[metric],
+                         r[metric] > b[metric] * (1 + threshold)))
+
+    return rows
+
+
+if __name__ == "__main__":
+    """! Entry point for running benchmarks """
+    parser = argparse.ArgumentParser(description="Benchmarks of mathematical library")
+    parser.add_argument("--max-exponent", type=int, default=6, help="largest size is 10 ^ MAX_EXPONENT")
+    parser.add_argument("--suite", metavar="JSON", help="run the suite and save its records to JSON")
+    parser.add_argument("--fixtures", help="directory for reused input files of the suite, temporary by default")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two saved runs of the suite")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        runs = []
+        for path in args.compare:
+            with open(path) as f:
+                runs.append(json.load(f))
+        rows = compareRuns(*runs, threshold=args.threshold)
+        print("case              size  metric            base          new    change")
+        for case, size, metric, base, new, regression in rows:
+            print("%-14s %8d  %-10s %12.6g %12.6g %+8.1f%%%s" % (case, size, metric, base, new,
+                                                                 100 * (new / base - 1) if base else 0,
+                                                                 "  REGRESSION" if regression else ""))
+        sys.exit(1 if any(row[-1] for row in rows) else 0)
+
+    if args.suite:
+        print("case              size    time [s]  throughput [1/s]  peak [B]")
+        records = runSuite(args.max_exponent, args.fixtures, report=lambda r: print(
+            "%-14s %8d %11.6f %17.0f %9d" % (r['case'], r['size'], r['seconds'], r['throughput'], r['peak bytes'])))
+        with open(args.suite, "w") as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'date': time.strftime("%Y-%m-%d %H:%M:%S"), 'records': records}, f, indent=1)
+        sys.exit(0)
+
+    r = benchLexer(10 ** args.max_exponent)
+    print("%d tokens         legacy [tok/s]  spaced [tok/s]  tight [tok/s]" % r['tokens'])
+    for stage in ("lex", "parse"):
+        print("%-16s %15.0f %15.0f %14.0f" % (stage, r[stage + ' legacy'], r[stage + ' spaced'], r[stage + ' tight']))
+
+    r = benchSolve(10 ** args.max_exponent)
+    print("%d tokens         legacy [tok/s]  bytecode [tok/s]" % r['tokens'])
+    print("%-16s %15.0f %17.0f" % ("solve", r['legacy'], r['bytecode']))
+    print("%-16s %15d %17d" % ("size [B]", r['legacy bytes'], r['bytecode bytes']))
+
+    print("backend          sum [s]  product [s]  factorial [s]")
+    for backend, r in benchBackends(10 ** min(args.max_exponent, 4)).items():
+        print("%-12s %11.4f %12.4f %14.4f" % (backend, r['sum'], r['product'], r['factorial']))
+
+    print("factorial      n    cold [s]    memo [s]   naive [s]")
+    for r in benchFact([10 ** e for e in range(3, args.max_exponent + 1)]):
+        naive = "%11.4f" % r['naive'] if r['naive'] is not None else "%11s" % "-"
+        print("%16d %11.4f %11.4f %s" % (r['n'], r['cold'], r['memo'], naive))
@@ -0,0 +1,196 @@
+"""!@package docstring
+    Project name: Calculator
+    File: calccli.py
+    Date: 18.10.2026
+    Last change: 18.10.2026
+    Authors: Jan Juda, Radek Duchoň, Markéta Nedělová
+    Licence: GNU GPLv2
+
+    Description: This file contains command line calculator solving math problems from files, one per line.
+
+
+    @file calccli.py
+
+    @brief This file contains command line calculator solving math problems from files, one per line.
+    @authors Jan Juda, Radek Duchoň, Markéta Nedělová
+
+"""
+
+import argparse
+import numbers
+import os
+import stat
+import sys
+from collections import deque
+from fractions import Fraction
+from mathlib import MathLib as m
+
+"""! Size of buffers of input and output files in bytes """
+BUFFER_SIZE = 1 << 20
+
+"""! Number of result lines written at once """
+WRITE_LINES = 4096
+
+
+def isRegular(f):
+    """! Checks whether file is a regular file, reading of which never waits for input
+    @param f binary file object
+    @return False for pipes, terminals and streams without a file descriptor
+    """
+
+    try:
+        return stat.S_ISREG(os.fstat(f.fileno()).st_mode)
+    except (OSError, ValueError):
+        return False
+
+
+def waitingLines(f, waiting):
+    """! Reads lines of a stream that may wait for input, all lines that already arrived are read at once
+    @param f binary file object
+    @param waiting function called before reading that may wait for input
+    @return generator of lines and None before each reading that may wait for input
+    """
+
+    rest = b""
+    while True:
+        yield None
+        waiting()
+        block = f.read1(BUFFER_SIZE)
+        if not block:
+            if rest:
+                yield rest
+            return
+        lines = (rest + block).split(b"\n")
+        rest = lines.pop()
+        for line in lines:
+            yield line + b"\n"
+
+
+def readLines(paths, positions, waiting=None):
+    """! Reads math problems from files, one per line, files are read in large blocks
+    @param paths paths to files, - for standard input
+    @param positions deque to which path, line number, emptiness and decoding error of each math problem are appended
+    @param waiting function called before reading a line from a pipe or terminal, e.g. to flush results
+    @return generator of math problems, an empty one for a line that is not valid UTF-8, and None before reading from
+    a pipe or terminal that may wait for input, so that MathLib.solve_batch yields results of the lines read so far
+    """
+
+    for path in paths:
+        f = sys.stdin.buffer if path == "-" else open(path, "rb", buffering=BUFFER_SIZE)
+        try:
+            lines = f if waiting is None or isRegular(f) else waitingLines(f, waiting)
+            number = 0
+            for line in lines:
+                if line is None:
+                    yield None
+                    continue
+                number += 1
+                try:
+                    line = line.decode()
+                except UnicodeDecodeError as e:
+                    positions.append((path, number, False, e))
+                    yield ""
+                    continue
+                positions.append((path, number, not line.strip(), None))
+                yield line
+        finally:
+            if f is not sys.stdin.buffer:
+                f.close()
+
+
+def formatResult(value, maxDigits=0):
+    """! Formats result of math problem, big integers are converted in subquadratic time
+    @param value result of math problem
+    @param maxDigits integers with more digits are printed in scientific notation, 0 prints all digits
+    @return text of the result
+    """
+
+    if value.__class__ is Fraction and value.denominator == 1:
+        value = value.numerator
+    if value.__class__ is int:
+        return m.format_result(value, maxDigits) if maxDigits else m.to_decimal_string(value)
+    if value.__class__ is Fraction:
+        return m.to_decimal_string(value.numerator) + "/" + m.to_decimal_string(value.denominator)
+
+    return str(value)
+
+
+def solveFiles(paths, output, errors, workers=1, chunkSize=256, backend=None, maxDigits=0):
+    """! Solves math problems from files line by line and writes results in the same order as soon as they are ready.
+    A failing math problem or a line that is not valid UTF-8 gives line ERROR and a message with its position,
+    the following ones are still solved. Empty lines stay empty. Results are written in blocks, and before reading
+    from a pipe or terminal that may wait for input, so results of slowly arriving input are not held back, even when
+    they are solved by worker processes in chunks.
+    @param paths paths to files, - for standard input
+    @param output text stream for results
+    @param errors text stream for messages about failing math problems
+    @param workers number of worker processes, None for all cores, 1 solves in this process
+    @param chunkSize number of math problems sent to a worker at once
+    @param backend name from MathLib.backends, float MathLib by default
+    @param maxDigits integers with more digits are printed in scientific notation, 0 prints all digits
+    @return number of failing math problems
+    """
+
+    positions = deque()
+    lines = []
+    failed = 0
+
+    def waiting():
+        if lines:
+            output.write("\n".join(lines) + "\n")
+            lines.clear()
+        output.flush()
+
+    for result in m.solve_batch(readLines(paths, positions, waiting), workers, chunkSize, backend):
+        path, number, empty, error = positions.popleft()
+        if error is None:
+            error = result.error
+        if error is None and not isinstance(result.value, numbers.Number):
+            # Incomplete math problem, e.g. a lone bracket
+            error = ValueError("not a number")
+        text = ""
+        if not empty and error is None:
+            try:
+                text = formatResult(result.value, maxDigits)
+            except Exception as e:
+                error = e
+        if empty or error is None:
+            lines.append(text)
+        else:
+            failed += 1
+            lines.append("ERROR")
+            errors.write("%s:%d: %s: %s\n" % ("<stdin>" if path == "-" else path, number, type(error).__name__, error))
+        if len(lines) >= WRITE_LINES:
+            output.write("\n".join(lines) + "\n")
+            lines.clear()
+
+    if lines:
+        output.write("\n".join(lines) + "\n")
+    output.flush()
+
+    return failed
+
+
+if __name__ == "__main__":
+    """! Entry point of command line calculator, exit status is 1 when any math problem failed """
+    parser = argparse.ArgumentParser(description="Solves math problems from files or standard input, one per line, "
+                                                 "and prints results line by line")
+    parser.add_argument("files", nargs="*", default=["-"], help="files with math problems, - for standard input")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="worker processes, 0 for all cores")
+    parser.add_argument("--chunk-size", type=int, default=256, help="math problems sent to a worker at once")
+    parser.add_argument("--backend", choices=sorted(m.backends), help="numeric backend, float by default")
+    parser.add_argument("-o", "--output", help="file for results, standard output by default")
+    parser.add_argument("--max-digits", type=int, default=0,
+                        help="integers with more digits are printed in scientific notation, all digits by default")
+    args = parser.parse_args()
+
+    output = open(args.output, "w", buffering=BUFFER_SIZE) if args.output else sys.stdout
+    try:
+        failed = solveFiles(args.files, output, sys.stderr, args.workers or None, args.chunk_size, args.backend,
+                            args.max_digits)
+    except BrokenPipeError:
+        sys.exit(1)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    sys.exit(1 if failed else 0)
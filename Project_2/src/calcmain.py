@@ -19,20 +19,145 @@
 
 """
 
+import multiprocessing
 import numbers
 import sys
 from os.path import realpath, dirname
-from mathlib import MathLib as m
-from PyQt5 import QtWidgets, QtGui
+from mathlib import MathLib as m, TokenBuffer
+from PyQt5 import QtCore, QtWidgets, QtGui
 from calc import Ui_MainWindow
 
 
+def _runJob(connection, function, args):
+    """! Runs function in a worker process and sends back its result
+    @param connection writable end of pipe to the GUI process
+    @param function function to be called
+    @param args arguments of the function
+    """
+
+    try:
+        connection.send((function(*args), None))
+    except Exception as e:
+        connection.send((None, e))
+    finally:
+        connection.close()
+
+
+def formatDuration(seconds):
+    """! Formats estimated duration for humans
+    @param seconds duration in seconds
+    @return text with duration in suitable units
+    """
+
+    for unit, size in (("days", 86400), ("hours", 3600), ("minutes", 60)):
+        if seconds >= 2 * size:
+            return "%.0f %s" % (seconds / size, unit)
+
+    return "%.1f seconds" % seconds
+
+
+class Job(QtCore.QObject):
+    """! Runs a function in a separate process, so the GUI responds during long computations and they can be cancelled.
+    A process is used instead of a thread, because big integer arithmetic holds the interpreter lock.
+    """
+
+    """! signal - job id, result and exception of a finished job, exception is None on success """
+    finished = QtCore.pyqtSignal(int, object, object)
+
+    def __init__(self, parent=None):
+        """! Constructor of the job runner
+        @param parent Qt parent object
+        """
+
+        super().__init__(parent)
+        self.id = 0
+        self.process = None
+        self.connection = None
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(20)
+        self.timer.timeout.connect(self.poll)
+
+    def busy(self):
+        """! Checks whether a job is running
+        @return True when a job is running
+        """
+
+        return self.process is not None
+
+    def start(self, function, *args):
+        """! Starts a new job, the running one is cancelled
+        @param function function to be called in the worker process
+        @param args arguments of the function
+        @return id of the new job
+        """
+
+        self.cancel()
+        self.id += 1
+        self.connection, child = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(target=_runJob, args=(child, function, args), daemon=True)
+        self.process.start()
+        child.close()
+        self.timer.start()
+
+        return self.id
+
+    def cancel(self):
+        """! Kills the running job, its result is never delivered """
+
+        if self.process is not None:
+            self.process.terminate()
+            self.stop()
+
+    def stop(self):
+        """! Releases resources of the finished or cancelled job """
+
+        self.timer.stop()
+        self.process.join()
+        self.connection.close()
+        self.process = None
+        self.connection = None
+
+    def poll(self):
+        """! Delivers result of the job when it is ready """
+
+        # Checked before the pipe, a process that sends its result and exits in between is not taken for failed
+        alive = self.process.is_alive()
+        if self.connection.poll():
+            try:
+                result, error = self.connection.recv()
+            except EOFError:
+                # The worker process died without sending result
+                result, error = None, ValueError("Exception")
+        elif not alive:
+            result, error = None, ValueError("Exception")
+        else:
+            return
+
+        self.stop()
+        self.finished.emit(self.id, result, error)
+
+
 class Controller:
     """! class that controls GUI """
 
     """! variable - list of supported operators"""
     operators = ["+", "-", "*", "/", "√", "^", "!", "%"]
 
+    """! variable - formulas estimated to take longer are solved in the background"""
+    backgroundSeconds = 0.05
+
+    """! variable - integer results with more digits are shown in scientific notation"""
+    displayDigits = 30
+
+    """! variable - digits on one line of the dialog with all digits of the result"""
+    dialogLineDigits = 100
+
+    """! variable - formulas estimated to take longer are not previewed"""
+    previewSeconds = 0.01
+
+    """! variable - milliseconds after the last keystroke before the preview is updated"""
+    previewDelay = 150
+
     def __init__(self, window):
         """! constructor of class that makes connection between the buttons and actions
         @param window: main application QMainWindow
@@ -67,6 +192,41 @@ class Controller:
         self.ui.btn_result.clicked.connect(self.solve)
         self.ui.actionAbout.triggered.connect(self.about)
         self.ui.actionHow_this_works.triggered.connect(self.help)
+        self.ui.display.textChanged.connect(self.displayChanged)
+
+        # Evaluation runs in a worker process with a progress indicator and a cancel button in the status bar
+        self.job = Job(window)
+        self.job.finished.connect(self.solved)
+        self.jobId = None
+        self.jobEquation = None
+        # The job converts all digits of the shown result instead of solving
+        self.jobDigits = False
+        self.result = None
+        self.resultText = None
+        self.progress = QtWidgets.QProgressBar()
+        self.progress.setRange(0, 0)
+        self.progress.setMaximumWidth(120)
+        self.progress.hide()
+        self.btn_cancel = QtWidgets.QPushButton("Cancel")
+        self.btn_cancel.setShortcut("Esc")
+        self.btn_cancel.clicked.connect(self.cancel)
+        self.btn_cancel.hide()
+        self.btn_digits = QtWidgets.QPushButton("All digits")
+        self.btn_digits.clicked.connect(self.showDigits)
+        self.btn_digits.hide()
+        self.statusBar = window.statusBar()
+        self.statusBar.addPermanentWidget(self.btn_digits)
+
+        # Tokens of the display are kept for the preview, only the edited end is parsed again after a keystroke
+        self.buffer = TokenBuffer()
+        self.preview = QtWidgets.QLabel()
+        self.statusBar.addWidget(self.preview)
+        self.previewTimer = QtCore.QTimer(window)
+        self.previewTimer.setSingleShot(True)
+        self.previewTimer.setInterval(self.previewDelay)
+        self.previewTimer.timeout.connect(self.updatePreview)
+        self.statusBar.addPermanentWidget(self.progress)
+        self.statusBar.addPermanentWidget(self.btn_cancel)
 
     def displayWrite(self, char):
         """! This function writes text on the display and defines rules for it
@@ -100,7 +260,7 @@ class Controller:
             elif char == "-":
                 self.ui.display.setText(text + char)
         elif char == ")":
-            if text.count("(") > text.count(")") and text[-2] != '(' and text[-1] != "-" and\
+            if self.buffer.depth() > 0 and text[-2] != '(' and text[-1] != "-" and\
                     (text[-2] not in self.operators or text[-1] != " " or text[-2] == "!"):
                 self.ui.display.setText(text + first_space + char + " ")
         elif char == "(":
@@ -124,17 +284,172 @@ class Controller:
         self.ui.display.setText(text)
 
     def solve(self):
-        """! Solves formula on display using mathematical library. Result is shown on the display. """
+        """! Solves formula on display using mathematical library. Result is shown on the display.
+        Cheap formulas are solved at once, expensive ones in the background.
+        """
+
+        equation = self.ui.display.text()
+        if self.job.busy() and equation == self.jobEquation:
+            return
 
         try:
-            solved = m.solve(self.ui.display.text())
-            if not isinstance(solved, numbers.Number):
-                # A result is not a number
-                solved = "ERROR"
+            postfix = m.parse(equation)
+        except Exception as e:
+            # Incorrect formula is reported at once
+            self.cancel()
+            self.showResult(None, e)
+            return
+        try:
+            cost = m.estimate(postfix)
         except Exception:
-            solved = "ERROR"
+            # Unknown cost, the formula may be expensive
+            cost = None
+
+        if cost is not None and cost.seconds < self.backgroundSeconds:
+            self.cancel()
+            try:
+                self.showResult(m.solve(equation), None)
+            except Exception as e:
+                self.showResult(None, e)
+            return
+
+        self.jobEquation = equation
+        self.jobDigits = False
+        self.jobId = self.job.start(m.solve, equation)
+        self.setBusy(True, cost)
+
+    def solved(self, jobId, solved, error):
+        """! Shows result of solving in the background on the display
+        @param jobId id of the finished job
+        @param solved result of the formula
+        @param error exception raised while solving, None on success
+        """
+
+        if jobId != self.jobId:
+            # A stale result of an older formula
+            return
+
+        self.jobId = None
+        self.setBusy(False)
+        if not self.jobDigits:
+            self.showResult(solved, error)
+        elif error is None:
+            # The display holds at most 32767 characters, the digits are shown in a dialog instead
+            self.digitsDialog(solved)
+
+    def showResult(self, solved, error):
+        """! Shows result of the formula on the display
+        @param solved result of the formula
+        @param error exception raised while solving, None on success
+        """
+
+        if error is not None or not isinstance(solved, numbers.Number):
+            # A result is not a number
+            self.ui.display.setText("ERROR")
+            return
+
+        # Only leading digits of a huge integer are computed, all digits are converted on request
+        text = m.format_result(solved, self.displayDigits)
+        if isinstance(solved, int) and "e" in text:
+            self.result = solved
+            self.resultText = text
+            self.btn_digits.show()
+        self.ui.display.setText(text)
+        if self.result is not None:
+            self.statusBar.showMessage("%d digits" % m.digits(solved))
+
+    def showDigits(self):
+        """! Shows all digits of the integer result, they are converted in the background """
+
+        if self.result is None:
+            return
+
+        self.jobEquation = self.resultText
+        self.jobDigits = True
+        self.jobId = self.job.start(m.to_decimal_string, self.result)
+        self.setBusy(True, message="Converting %d digits..." % m.digits(self.result))
 
-        self.ui.display.setText(str(solved))
+    def cancel(self):
+        """! Cancels solving of the formula, the formula stays on the display """
+
+        self.job.cancel()
+        self.jobId = None
+        self.setBusy(False)
+
+    def displayChanged(self, text):
+        """! Drops the running computation when the formula on display was changed
+        @param text new text of the display
+        """
+
+        self.buffer.set_text(text)
+        self.previewTimer.start()
+        if self.jobId is not None and text != self.jobEquation:
+            self.cancel()
+        if self.result is not None and text != self.resultText:
+            # The shortened result is not shown anymore
+            self.result = None
+            self.resultText = None
+            self.btn_digits.hide()
+            self.statusBar.clearMessage()
+
+    def updatePreview(self):
+        """! Shows result of the formula on display in the status bar, when it is complete and cheap """
+
+        result = self.buffer.preview(self.previewSeconds) if len(self.buffer.tokens) > 1 else None
+        if isinstance(result, numbers.Number):
+            self.preview.setText("= " + m.format_result(result, self.displayDigits))
+        else:
+            self.preview.clear()
+
+    def setBusy(self, busy, cost=None, message=None):
+        """! Shows or hides the progress indicator and the cancel button
+        @param busy True when a computation is running
+        @param cost CostEstimate of the running computation, None when it is unknown
+        @param message status message shown instead of estimated duration
+        """
+
+        self.progress.setVisible(busy)
+        self.btn_cancel.setVisible(busy)
+        if busy:
+            if message is None:
+                message = "Computing..." if cost is None else "Computing... (about %s)" % formatDuration(cost.seconds)
+            self.statusBar.showMessage(message)
+        else:
+            self.statusBar.clearMessage()
+
+    @staticmethod
+    def digitsDialog(digits):
+        """! Shows all digits of the result in a scrollable dialog, they can be saved to a file
+        @param digits string with decimal digits of the result
+        """
+
+        dialog = QtWidgets.QDialog()
+        dialog.setWindowTitle("%d digits" % len(digits.lstrip("-")))
+        text = QtWidgets.QPlainTextEdit()
+        text.setReadOnly(True)
+        text.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        # Short lines are laid out much faster than one line of a million digits
+        step = Controller.dialogLineDigits
+        text.setPlainText("\n".join(digits[i:i + step] for i in range(0, len(digits), step)))
+        buttons = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Save | QtWidgets.QDialogButtonBox.Close)
+        buttons.rejected.connect(dialog.reject)
+
+        def save():
+            path = QtWidgets.QFileDialog.getSaveFileName(dialog, "Save digits", "result.txt")[0]
+            if not path:
+                return
+            try:
+                with open(path, "w") as f:
+                    f.write(digits + "\n")
+            except OSError as e:
+                QtWidgets.QMessageBox.warning(dialog, "Save digits", str(e))
+
+        buttons.accepted.connect(save)
+        layout = QtWidgets.QVBoxLayout(dialog)
+        layout.addWidget(text)
+        layout.addWidget(buttons)
+        dialog.resize(800, 500)
+        dialog.exec_()
 
     @staticmethod
     def about():
@@ -191,11 +506,13 @@ class Controller:
                                   " - using operators on incorrect numbers (such as factorial on a float or power with"
                                   "float degree.\n"
                                   "\n"
-                                  "If application \"freezes\" then you have probably typed some long time-"
-                                  "consuming formula.\n"
-                                  "For example factorial of number greater than 50000 or power/root with high degree.\n"
-                                  "If this happens, you can simply wait for the computation to finish or "
-                                  "kill the application.")
+                                  "Long time-consuming formulas (for example factorial of a huge number or power "
+                                  "with high degree)\n"
+                                  "are computed in the background, progress is shown in the status bar.\n"
+                                  "You can keep typing, wait for the computation to finish or cancel it "
+                                  "with the 'Cancel' button (Esc).\n"
+                                  "\n"
+                                  "Result of a short formula is previewed in the status bar while you type.")
         dialog.adjustSize()
         dialog.exec_()
 
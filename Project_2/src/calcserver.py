@@ -0,0 +1,532 @@
+"""!@package docstring
+    Project name: Calculator
+    File: calcserver.py
+    Date: 18.10.2026
+    Last change: 18.10.2026
+    Authors: Jan Juda, Radek Duchoň, Markéta Nedělová
+    Licence: GNU GPLv2
+
+    Description: This file contains local calculation service, HTTP server with JSON interface of mathematical library.
+
+
+    @file calcserver.py
+
+    @brief This file contains local calculation service, HTTP server with JSON interface of mathematical library.
+    @authors Jan Juda, Radek Duchoň, Markéta Nedělová
+
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from mathlib import MathLib as m
+
+"""! Reason phrases of HTTP status codes sent by the server """
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           422: "Unprocessable Entity", 500: "Internal Server Error", 501: "Not Implemented", 502: "Bad Gateway",
+           503: "Service Unavailable", 504: "Gateway Timeout"}
+
+"""! Largest size of head of a request in bytes """
+MAX_HEAD = 1 << 16
+
+"""! Largest size of body of a request in bytes """
+MAX_BODY = 1 << 20
+
+"""! Number of requests of one connection processed at once, further pipelined requests wait in the socket """
+MAX_PIPELINE = 32
+
+"""! Number of the latest latencies kept for percentiles """
+LATENCY_WINDOW = 10000
+
+"""! Integers with more bits are sent as strings of decimal digits, JSON parsers would round them """
+MAX_NUMBER_BITS = 3000
+
+
+class HttpError(Exception):
+    """! Malformed request, the connection is closed after the response """
+
+    def __init__(self, status):
+        """! Constructor of the error
+        @param status HTTP status code of the response
+        """
+
+        super().__init__(REASONS[status])
+        self.status = status
+
+
+class Overloaded(Exception):
+    """! Queue of expensive math problems is full """
+
+
+class WorkerFailed(Exception):
+    """! Worker process died before sending the result, e.g. it was killed for lack of memory """
+
+
+def encode(data):
+    """! Encodes body of a response
+    @param data JSON serializable object
+    @return bytes with JSON text
+    """
+
+    return json.dumps(data).encode()
+
+
+def jsonValue(result):
+    """! Converts result to JSON value, numbers that JSON cannot represent exactly are converted to strings
+    @param result result of the math problem
+    @return int, finite float or string
+    """
+
+    if isinstance(result, int):
+        return result if result.bit_length() <= MAX_NUMBER_BITS else m.to_decimal_string(result)
+    if isinstance(result, float) and math.isfinite(result):
+        return result
+
+    return str(result)
+
+
+def solveRequest(expression, backend=None):
+    """! Solves math problem and encodes the response, big results are encoded in the process that solved them
+    @param expression string with math problem
+    @param backend name from MathLib.backends, float MathLib by default
+    @return pair of HTTP status and body of response
+    """
+
+    try:
+        result = m.solve(expression, backend)
+    except Exception as e:
+        return 422, encode({'error': type(e).__name__, 'message': str(e)})
+
+    return 200, encode({'result': jsonValue(result), 'type': type(result).__name__})
+
+
+def _work(connection):
+    """! Main loop of a worker process, solves math problems received through pipe until it is closed
+    @param connection end of pipe to the server
+    """
+
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        connection.send(solveRequest(*request))
+
+
+def percentiles(values):
+    """! Summarizes latencies
+    @param values latencies in seconds
+    @return dict with count, median, 90th and 99th percentile and maximum, nearest rank is used
+    """
+
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+
+    def rank(q):
+        return values[max(math.ceil(q * len(values)) - 1, 0)]
+
+    return {'count': len(values), 'p50': rank(0.5), 'p90': rank(0.9), 'p99': rank(0.99), 'max': values[-1]}
+
+
+class Worker:
+    """! Worker process solving expensive math problems, it is replaced when its math problem times out """
+
+    """! class variable - multiprocessing context, worker processes do not inherit threads of the server """
+    context = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+                                          else "spawn")
+
+    def __init__(self):
+        """! Constructor of the worker, starts the process """
+
+        self.connection, child = Worker.context.Pipe()
+        self.process = Worker.context.Process(target=_work, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+    def stop(self):
+        """! Kills the process, a thread waiting for its result gets EOFError """
+
+        self.process.kill()
+        self.process.join()
+
+
+class WorkerPool:
+    """! Bounded pool of worker processes with bounded queue of waiting math problems """
+
+    def __init__(self, workers=None, queueSize=64):
+        """! Constructor of the pool, starts the processes
+        @param workers number of worker processes, all cores by default
+        @param queueSize largest number of math problems waiting for a worker
+        """
+
+        self.size = workers or os.cpu_count() or 1
+        self.queueSize = queueSize
+        self.waiting = 0
+        self.workers = [Worker() for _ in range(self.size)]
+        self.idle = asyncio.Queue()
+        for worker in self.workers:
+            self.idle.put_nowait(worker)
+        # Threads waiting for results, one per worker, so the event loop never blocks on a pipe
+        self.threads = ThreadPoolExecutor(self.size)
+
+    def busy(self):
+        """! Returns number of workers solving a math problem """
+
+        return self.size - self.idle.qsize()
+
+    async def solve(self, expression, backend, timeout):
+        """! Solves math problem in a worker process
+        @param expression string with math problem
+        @param backend name from MathLib.backends or None
+        @param timeout seconds for waiting in the queue and solving together
+        @return pair of HTTP status and body of response
+        @throws Overloaded when the queue is full
+        @throws asyncio.TimeoutError when the math problem is not solved in time, its worker is replaced
+        @throws WorkerFailed when the worker process died, it is replaced
+        """
+
+        if self.waiting >= self.queueSize:
+            raise Overloaded()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        self.waiting += 1
+        try:
+            worker = await asyncio.wait_for(self.idle.get(), timeout)
+        finally:
+            self.waiting -= 1
+
+        try:
+            if not worker.process.is_alive():
+                # Died while idle, the math problem is solved by a new worker
+                worker = self.replace(worker)
+            worker.connection.send((expression, backend))
+            return await asyncio.wait_for(loop.run_in_executor(self.threads, worker.connection.recv),
+                                          max(deadline - loop.time(), 0))
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # The worker is still computing, it cannot be interrupted in any other way
+            worker = self.replace(worker)
+            raise
+        except (EOFError, OSError):
+            # Broken pipe of a dead process
+            worker = self.replace(worker)
+            raise WorkerFailed()
+        finally:
+            self.idle.put_nowait(worker)
+
+    def replace(self, worker):
+        """! Kills worker process and starts a new one in its place
+        @param worker worker to be replaced
+        @return the new worker
+        """
+
+        worker.stop()
+        self.workers.remove(worker)
+        worker = Worker()
+        self.workers.append(worker)
+
+        return worker
+
+    def close(self):
+        """! Stops all worker processes """
+
+        for worker in self.workers:
+            worker.stop()
+        self.threads.shutdown(wait=False, cancel_futures=True)
+
+
+class CalcServer:
+    """! HTTP/1.1 server solving math problems,
+    POST /solve with JSON {"expression": ..., "backend": ..., "timeout": ...} and GET /metrics.
+    Pipelined requests of one connection are processed concurrently and answered in order.
+    Cheap math problems are solved at once in the event loop, expensive ones by estimate in the worker pool.
+    """
+
+    def __init__(self, workers=None, queueSize=64, timeout=10.0, maxTimeout=60.0, cheapSeconds=1e-3):
+        """! Constructor of the server
+        @param workers number of worker processes, all cores by default
+        @param queueSize largest number of expensive math problems waiting for a worker, the next ones get 503
+        @param timeout default seconds for solving a math problem, 504 is sent after it
+        @param maxTimeout largest timeout that a request may ask for
+        @param cheapSeconds math problems estimated faster than this are solved in the event loop, only float
+        MathLib is estimated, other backends always use the worker pool
+        """
+
+        self.workers = workers
+        self.queueSize = queueSize
+        self.timeout = timeout
+        self.maxTimeout = maxTimeout
+        self.cheapSeconds = cheapSeconds
+        self.pool = None
+        self.connections = 0
+        self.counters = {'requests': 0, 'solved': 0, 'failed': 0, 'rejected': 0, 'timeouts': 0, 'bad_requests': 0,
+                         'worker_failures': 0, 'internal_errors': 0}
+        self.latencies = {'inline': deque(maxlen=LATENCY_WINDOW), 'pool': deque(maxlen=LATENCY_WINDOW)}
+
+    async def serve(self, host="127.0.0.1", port=8080, path=None, started=None):
+        """! Runs the server until it is cancelled
+        @param host address to listen on
+        @param port TCP port to listen on
+        @param path path of Unix socket to listen on instead of TCP
+        @param started function called with the listening server
+        """
+
+        self.pool = WorkerPool(self.workers, self.queueSize)
+        try:
+            if path is not None:
+                server = await asyncio.start_unix_server(self.connection, path, limit=MAX_HEAD)
+            else:
+                server = await asyncio.start_server(self.connection, host, port, limit=MAX_HEAD)
+            async with server:
+                if started is not None:
+                    started(server)
+                await server.serve_forever()
+        finally:
+            self.pool.close()
+
+    async def connection(self, reader, writer):
+        """! Reads requests of one connection, responses are written by CalcServer.send in order of requests
+        @param reader stream of the connection
+        @param writer stream of the connection
+        """
+
+        self.connections += 1
+        responses = asyncio.Queue(MAX_PIPELINE)
+        sender = asyncio.create_task(self.send(responses, writer))
+        try:
+            keepAlive = True
+            while keepAlive:
+                try:
+                    request = await self.read(reader)
+                except HttpError as e:
+                    self.counters['bad_requests'] += 1
+                    await responses.put((self.error(e.status, str(e)), False))
+                    break
+                if request is None:
+                    break
+                method, target, body, keepAlive = request
+                self.counters['requests'] += 1
+                await responses.put((asyncio.ensure_future(self.respond(method, target, body)), keepAlive))
+        except ConnectionError:
+            pass
+        finally:
+            await responses.put(None)
+            await sender
+            writer.close()
+            self.connections -= 1
+
+    async def send(self, responses, writer):
+        """! Writes responses in order of requests, responses are dropped when the client is gone
+        @param responses queue of pairs of response or awaitable response and keep alive flag, None at the end
+        @param writer stream of the connection
+        """
+
+        connected = True
+        while True:
+            item = await responses.get()
+            if item is None:
+                return
+            response, keepAlive = item
+            if not connected:
+                if asyncio.isfuture(response):
+                    response.cancel()
+                continue
+
+            try:
+                status, body = await response if asyncio.isfuture(response) else response
+            except Exception as e:
+                # A failed request must not stall the following ones
+                self.counters['internal_errors'] += 1
+                status, body = self.error(500, "%s: %s" % (type(e).__name__, e))
+            head = "HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n" % (
+                status, REASONS[status], len(body))
+            if status == 503:
+                head += "Retry-After: 1\r\n"
+            if not keepAlive:
+                head += "Connection: close\r\n"
+            try:
+                writer.write(head.encode() + b"\r\n" + body)
+                await writer.drain()
+            except ConnectionError:
+                connected = False
+
+    @staticmethod
+    async def read(reader):
+        """! Reads one request
+        @param reader stream of the connection
+        @return tuple of method, target, body and keep alive flag, None when the client closed the connection
+        @throws HttpError when the request is malformed
+        """
+
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise HttpError(400)
+            return None
+        except asyncio.LimitOverrunError:
+            raise HttpError(413)
+
+        lines = head.decode("latin-1").lstrip("\r\n").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            raise HttpError(400)
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, colon, value = line.partition(":")
+                if not colon:
+                    raise HttpError(400)
+                headers[name.strip().lower()] = value.strip()
+
+        if "transfer-encoding" in headers:
+            raise HttpError(501)
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HttpError(400)
+        if length < 0:
+            raise HttpError(400)
+        if length > MAX_BODY:
+            raise HttpError(413)
+        try:
+            body = await reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            return None
+
+        connection = headers.get("connection", "").lower()
+        keepAlive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+        return method, target, body, keepAlive
+
+    @staticmethod
+    def error(status, message):
+        """! Creates response with an error
+        @param status HTTP status code
+        @param message description of the error
+        @return pair of HTTP status and body of response
+        """
+
+        return status, encode({'error': REASONS[status], 'message': message})
+
+    async def respond(self, method, target, body):
+        """! Creates response to one request
+        @param method HTTP method
+        @param target path of the request
+        @param body body of the request
+        @return pair of HTTP status and body of response
+        """
+
+        path = target.partition("?")[0]
+        if path == "/solve":
+            if method != "POST":
+                return self.error(405, "use POST")
+            return await self.solve(body)
+        if path == "/metrics":
+            if method != "GET":
+                return self.error(405, "use GET")
+            return 200, encode(self.metrics())
+
+        return self.error(404, "unknown path")
+
+    async def solve(self, body):
+        """! Solves math problem of a request, cheap ones at once and expensive ones in the worker pool
+        @param body JSON with expression, optional backend and timeout in seconds
+        @return pair of HTTP status and body of response
+        """
+
+        start = time.perf_counter()
+        try:
+            request = json.loads(body)
+            expression = request['expression']
+            backend = request.get('backend')
+            timeout = min(float(request.get('timeout', self.timeout)), self.maxTimeout)
+            if not isinstance(expression, str) or backend is not None and backend not in m.backends or not timeout > 0:
+                raise ValueError("Exception")
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.counters['bad_requests'] += 1
+            return self.error(400, "expected JSON object with expression, backend from %s and timeout"
+                              % ", ".join(sorted(m.backends)))
+
+        route = 'inline' if self.cheap(expression, backend) else 'pool'
+        try:
+            if route == 'inline':
+                status, answer = solveRequest(expression, backend)
+            else:
+                status, answer = await self.pool.solve(expression, backend, timeout)
+        except Overloaded:
+            self.counters['rejected'] += 1
+            return self.error(503, "too many math problems are waiting")
+        except asyncio.TimeoutError:
+            self.counters['timeouts'] += 1
+            return self.error(504, "not solved in %g seconds" % timeout)
+        except WorkerFailed:
+            self.counters['worker_failures'] += 1
+            return self.error(502, "worker process died, it was replaced")
+
+        self.latencies[route].append(time.perf_counter() - start)
+        self.counters['solved' if status == 200 else 'failed'] += 1
+
+        return status, answer
+
+    def cheap(self, expression, backend):
+        """! Decides whether math problem is solved in the event loop, the estimate models only float MathLib
+        @param expression string with math problem
+        @param backend name from MathLib.backends or None
+        @return True for incorrect math problems and for cheap ones solved by float MathLib
+        """
+
+        try:
+            postfix = m.parse(expression)
+        except Exception:
+            # Incorrect math problem, solving it reports the error at once
+            return True
+        if backend is not None and m.backends[backend] is not m:
+            return False
+        try:
+            return m.estimate(postfix).seconds < self.cheapSeconds
+        except Exception:
+            # Unknown cost, the math problem may be expensive
+            return False
+
+    def metrics(self):
+        """! Returns metrics of the server
+        @return dict with counters, connections, queue depth, busy workers and latency percentiles of both routes
+        """
+
+        return dict(self.counters, connections=self.connections, queue_depth=self.pool.waiting,
+                    busy_workers=self.pool.busy(), workers=self.pool.size,
+                    latency={route: percentiles(values) for route, values in self.latencies.items()})
+
+
+if __name__ == "__main__":
+    """! Entry point of the calculation service """
+    parser = argparse.ArgumentParser(description="Local calculation service, POST /solve with JSON "
+                                                 "{\"expression\": \"1 + 2\"} and GET /metrics")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="TCP port to listen on")
+    parser.add_argument("--unix", metavar="PATH", help="listen on Unix socket instead of TCP")
+    parser.add_argument("-j", "--workers", type=int, help="worker processes for expensive math problems, all cores "
+                                                          "by default")
+    parser.add_argument("--queue", type=int, default=64, help="expensive math problems waiting for a worker, "
+                                                              "further ones are rejected with 503")
+    parser.add_argument("--timeout", type=float, default=10.0, help="default seconds for one math problem")
+    parser.add_argument("--max-timeout", type=float, default=60.0, help="largest timeout a request may ask for")
+    parser.add_argument("--cheap-seconds", type=float, default=1e-3,
+                        help="math problems estimated faster than this are solved without a worker")
+    args = parser.parse_args()
+
+    service = CalcServer(args.workers, args.queue, args.timeout, args.max_timeout, args.cheap_seconds)
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.unix, started=lambda server: print(
+            "listening on %s" % ", ".join(str(socket.getsockname()) for socket in server.sockets), flush=True)))
+    except KeyboardInterrupt:
+        pass
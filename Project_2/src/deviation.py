@@ -16,30 +16,276 @@
 
 """
 
+import argparse
+import os
 import sys
-from src.mathlib import MathLib as m
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from mathlib import RunningStats, np
+
+"""! Whitespace characters separating values """
+WHITESPACE = (b" ", b"\n", b"\t", b"\r", b"\x0b", b"\x0c")
+
+"""! Formats of input file, text with whitespace separated values, raw little endian float64 and numpy .npy file """
+FORMATS = ('text', 'raw', 'npy')
+
+"""! Number of binary values reduced at once, 256 KiB fit into cache """
+CACHE_BLOCK = 1 << 15
+
+
+def statsLines(stream):
+    """! Reads lines from text stream, splits each line by whitespaces and adds the given values one by one.
+    @param stream text stream with values
+    @return RunningStats of values
+    """
+
+    stats = RunningStats()
+    for line in stream:
+        for number_str in line.split():
+            stats.push(float(number_str))
+
+    return stats
+
+
+def statsChunked(stream, blockSize=1 << 20):
+    """! Reads large blocks from binary stream, parses each block at once into float64 array and adds it vectorized.
+    A number split by the end of a block is carried over to the next block.
+    @param stream binary stream with values
+    @param blockSize number of bytes read at once
+    @pre numpy is installed
+    @return RunningStats of values
+    """
+
+    stats = RunningStats()
+    rest = b""
+
+    while True:
+        data = stream.read(blockSize)
+        block = rest + data
+        rest = b""
+        if data and not block[-1:].isspace():
+            # The last number may continue in the next block
+            cut = max(block.rfind(space) for space in WHITESPACE) + 1
+            block, rest = block[:cut], block[cut:]
+
+        stats.push_many(parseBlock(block))
+        if not data:
+            break
+
+    return stats
+
+
+def parseBlock(block):
+    """! Parses whitespace separated values at once
+    @param block bytes with values
+    @pre numpy is installed
+    @return float64 array with values
+    """
+
+    if block.isspace():
+        # NumPy parses whitespace without any value as -1
+        return np.empty(0)
+
+    with warnings.catch_warnings():
+        # Invalid value stops parsing with a warning, report it as an error instead
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return np.fromstring(block, dtype=np.float64, sep=" ")
+        except DeprecationWarning:
+            raise ValueError("Exception")
+
+
+def shardBounds(path, shardSize):
+    """! Splits file into byte ranges of roughly equal size, each range starts at a whitespace, so no value is split.
+    Ranges depend only on the file and shard size, not on the number of workers.
+    @param path path to file with values
+    @param shardSize approximate number of bytes in one range
+    @return list of (start, end) byte ranges covering whole file
+    """
+
+    size = os.path.getsize(path)
+    starts = [0]
+    with open(path, "rb") as f:
+        for position in range(shardSize, size, shardSize):
+            position = max(position, starts[-1])
+            f.seek(position)
+            while position < size:
+                block = f.read(4096)
+                cut = min((i for i in (block.find(space) for space in WHITESPACE) if i >= 0), default=-1)
+                if cut >= 0:
+                    position += cut
+                    break
+                position += len(block)
+            if position > starts[-1]:
+                starts.append(position)
+
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def shardStats(path, start, end):
+    """! Computes partial summary of values in a byte range of file
+    @param path path to file with values
+    @param start first byte of range
+    @param end byte after range
+    @pre range starts and ends on whitespace or on file boundary
+    @return RunningStats of values in range
+    """
+
+    with open(path, "rb") as f:
+        f.seek(start)
+        block = f.read(end - start)
+
+    stats = RunningStats()
+    stats.push_many(parseBlock(block) if np is not None else map(float, block.split()))
+
+    return stats
+
+
+def statsFile(path, workers=None, shardSize=64 << 20, format=None):
+    """! Computes summary of values in a file in parallel.
+    Partial summaries of shards are merged pairwise in a fixed tree, so the result does not depend on workers count.
+    Binary files are memory-mapped, each worker maps the file again and reads only its range.
+    @param path path to file with values
+    @param workers number of worker processes, all cores by default
+    @param shardSize approximate number of bytes processed by one worker at once
+    @param format name of format from FORMATS, detected by fileFormat by default
+    @pre numpy is installed for binary formats
+    @return RunningStats of values
+    """
+
+    format = format or fileFormat(path)
+    if format == 'text':
+        bounds = shardBounds(path, shardSize)
+        function, arguments = shardStats, ([path] * len(bounds),)
+    else:
+        count = len(mapValues(path, format))
+        shard = max(shardSize // 8, 1)
+        bounds = [(start, min(start + shard, count)) for start in range(0, count, shard)] or [(0, 0)]
+        function, arguments = binaryShardStats, ([path] * len(bounds), [format] * len(bounds))
+
+    if len(bounds) == 1 or workers == 1:
+        summaries = [function(*args) for args in zip(*arguments, *zip(*bounds))]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            summaries = list(executor.map(function, *arguments, *zip(*bounds)))
+
+    while len(summaries) > 1:
+        merged = [a.merge(b) for a, b in zip(summaries[::2], summaries[1::2])]
+        summaries = merged + summaries[len(merged) * 2:]
+
+    return summaries[0]
+
+
+def fileFormat(path):
+    """! Detects format of input file, .npy by its magic bytes, raw by extension .f64, .raw or .bin
+    @param path path to file with values
+    @return name of format from FORMATS
+    """
+
+    with open(path, "rb") as f:
+        if f.read(6) == b"\x93NUMPY":
+            return 'npy'
+    if path.endswith((".f64", ".raw", ".bin")):
+        return 'raw'
+
+    return 'text'
+
+
+def mapValues(path, format):
+    """! Memory-maps binary file with values, nothing is read until values are used
+    @param path path to file with values
+    @param format raw or npy
+    @pre numpy is installed
+    @return one-dimensional read-only array of values
+    """
+
+    if format == 'npy':
+        values = np.load(path, mmap_mode="r")
+        if values.dtype.kind not in "fiu":
+            raise ValueError("Exception")
+        # Order of values does not matter, reshape would copy Fortran-ordered array into memory
+        return values.ravel(order="K")
+
+    size = os.path.getsize(path)
+    if size % 8:
+        raise ValueError("Exception")
+    if not size:
+        # Empty file cannot be mapped
+        return np.empty(0)
+
+    return np.memmap(path, dtype="<f8", mode="r")
+
+
+def statsMapped(values, start=0, end=None, blockSize=CACHE_BLOCK):
+    """! Adds values of memory-mapped array in blocks, each block is a view of the mapping, so values are read only once
+    @param values one-dimensional array of values
+    @param start index of the first value
+    @param end index after the last value, the end of array by default
+    @param blockSize number of values reduced at once
+    @pre numpy is installed
+    @return RunningStats of values
+    """
+
+    stats = RunningStats()
+    end = len(values) if end is None else end
+    for position in range(start, end, blockSize):
+        stats.push_many(values[position:min(position + blockSize, end)])
+
+    return stats
+
+
+def binaryShardStats(path, format, start, end):
+    """! Computes partial summary of a range of values in binary file
+    @param path path to file with values
+    @param format raw or npy
+    @param start index of the first value
+    @param end index after the last value
+    @pre numpy is installed
+    @return RunningStats of values in range
+    """
+
+    return statsMapped(mapValues(path, format), start, end)
+
+
+def deviation(stats):
+    """! Calculates selective standard deviation
+    @param stats RunningStats of values
+    @return selective standard deviation, zero if there are no values
+    """
+
+    if stats.n == 0:
+        return 0
+
+    return stats.stdev
+
 
 if __name__ == "__main__":
     """! Main function for profiling task.
-    Reads lines from standard input, splits each line by whitespaces and parses the given values.
-    Calculates standard deviation from parsed values and prints it on standard output.
-    If there are no values on standard input, zero is returned.
+    Reads values from standard input or a file and calculates standard deviation from them and prints it on standard
+    output. A file is split into shards processed by worker processes, binary files are memory-mapped.
+    If there are no values on the input, zero is returned.
     @pre there are only valid number on the standard input and they are separated by whitespaces
     """
-    N = 0
-    x_sum = 0
-    x_square_sum = 0
-
-    for line in sys.stdin:
-        for number_str in line.split():
-            N = m.add(N, 1)
-            number = float(number_str)
-            x_sum = m.add(x_sum, number)
-            x_square_sum = m.add(x_square_sum, m.pow(number, 2))
+    parser = argparse.ArgumentParser(description="Selective standard deviation of values from standard input")
+    parser.add_argument("file", nargs="?", help="file with values, it is processed on all cores")
+    parser.add_argument("--chunked", action="store_true",
+                        help="read large blocks and parse them with numpy instead of line by line")
+    parser.add_argument("--block-size", type=int, default=1 << 20, help="bytes read at once in chunked mode")
+    parser.add_argument("-j", "--workers", type=int, help="worker processes for a file, all cores by default")
+    parser.add_argument("--shard-size", type=int, default=64 << 20, help="bytes of a file processed by one worker")
+    parser.add_argument("--format", choices=FORMATS,
+                        help="format of the file, .npy is detected by magic bytes and raw float64 by extension "
+                             ".f64, .raw or .bin by default")
+    args = parser.parse_args()
 
-    if N == 0:
-        print(0)
+    if args.file:
+        format = args.format or fileFormat(args.file)
+        if format != 'text' and np is None:
+            parser.error("binary input requires numpy")
+        print(deviation(statsFile(args.file, args.workers, args.shard_size, format)))
+    elif args.chunked:
+        if np is None:
+            parser.error("--chunked requires numpy")
+        print(deviation(statsChunked(sys.stdin.buffer, args.block_size)))
     else:
-        mean = m.div(x_sum, N)
-        # selective standard deviation computation
-        print(m.root(m.div(m.sub(x_square_sum, m.mul(N, m.pow(mean, 2))), m.sub(N, 1)), 2))
+        print(deviation(statsLines(sys.stdin)))
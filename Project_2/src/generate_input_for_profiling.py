@@ -2,7 +2,7 @@
     Project name: Calculator
     File: generate_input_for_profiling.py
     Date: 19.04.2020
-    Last change: 19.04.2020
+    Last change: 18.10.2026
     Authors: Jan Juda, Radek Duchoň, Markéta Nedělová
 
     Description: This file generates input files for profiling.
@@ -15,8 +15,24 @@
 
 """
 
+import argparse
+import sys
 from random import uniform
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""! Distributions of generated values, functions of numpy generator and number of values """
+DISTRIBUTIONS = {'uniform': lambda generator, n: generator.uniform(0, 1000, n),
+                 'normal': lambda generator, n: generator.normal(500, 100, n),
+                 # Lomax distribution, its variance is still finite
+                 'heavy': lambda generator, n: generator.pareto(2.5, n) * 100}
+
+"""! Output formats, text with one value per line, raw little endian float64 and numpy .npy file """
+FORMATS = ('text', 'raw', 'npy')
+
 
 def generateNumbers(filename, N):
     """! Function generates N number of random numbers from interval 0 to 1000 with uniform distribution and saves them
@@ -30,10 +46,107 @@ def generateNumbers(filename, N):
     f.close()
 
 
+def formatFixed(values, decimals=6):
+    """! Formats values as text at once, one value per line with fixed number of decimals.
+    Digits are computed by integer arithmetic on whole array, lines are right aligned by spaces.
+    @param values float64 array
+    @param decimals number of digits after decimal point
+    @pre numpy is installed
+    @return bytes with formatted values
+    """
+
+    magnitude = np.abs(values).max(initial=0.0)
+    if not np.isfinite(magnitude) or magnitude >= 2.0 ** 63 / 10 ** decimals:
+        # Digits do not fit into 64 bit integer
+        return "".join("%.*f\n" % (decimals, x) for x in values.tolist()).encode()
+
+    scaled = np.rint(np.abs(values) * 10.0 ** decimals).astype(np.uint64)
+    digits = max(len(str(int(scaled.max(initial=0)))), decimals + 1)
+    # Sign, digits, decimal point and new line
+    width = digits + 3
+    point = width - 2 - decimals
+    lines = np.empty((len(values), width), np.uint8)
+    for column in range(width - 2, 0, -1):
+        if column != point:
+            lines[:, column] = scaled % 10 + ord('0')
+            scaled //= 10
+    lines[:, 0] = ord(' ')
+    lines[:, point] = ord('.')
+    lines[:, -1] = ord('\n')
+
+    # Leading zeros of integer part are replaced by spaces, minus is put before the first digit
+    integer = lines[:, 1:point - 1]
+    significant = np.maximum.accumulate(integer != ord('0'), axis=1)
+    integer[~significant] = ord(' ')
+    first = np.where(significant[:, -1], significant.argmax(axis=1), integer.shape[1]) if integer.size else 0
+    negative = np.flatnonzero(values < 0)
+    lines[negative, np.broadcast_to(first, len(values))[negative]] = ord('-')
+
+    return lines.tobytes()
+
+
+def generateFile(filename, N, seed=None, distribution='uniform', format='text', chunkSize=1 << 20, decimals=6):
+    """! Generates N random values in chunks, so memory does not depend on N.
+    The same seed and chunk size give the same values.
+    @param filename name of file to save generated values to, - for standard output
+    @param N number of values to generate
+    @param seed seed of random generator, random by default
+    @param distribution name of distribution from DISTRIBUTIONS
+    @param format output format from FORMATS
+    @param chunkSize number of values generated at once
+    @param decimals number of digits after decimal point of text format
+    @pre numpy is installed
+    """
+
+    generator = np.random.default_rng(seed)
+    f = sys.stdout.buffer if filename == "-" else open(filename, "wb")
+    try:
+        if format == 'npy':
+            np.lib.format.write_array_header_1_0(f, {'descr': '<f8', 'fortran_order': False, 'shape': (N,)})
+        for start in range(0, N, chunkSize):
+            values = DISTRIBUTIONS[distribution](generator, min(chunkSize, N - start))
+            if format == 'text':
+                f.write(formatFixed(values, decimals))
+            else:
+                f.write(values.astype('<f8', copy=False).tobytes())
+    finally:
+        if f is not sys.stdout.buffer:
+            f.close()
+
+
+def formatOf(filename):
+    """! Guesses output format from extension of file name
+    @param filename name of file
+    @return npy for .npy, raw for .f64, .raw and .bin, text otherwise
+    """
+
+    if filename.endswith(".npy"):
+        return 'npy'
+    if filename.endswith((".f64", ".raw", ".bin")):
+        return 'raw'
+
+    return 'text'
+
+
 if __name__ == "__main__":
-    """ Entry point for generating input files from assignment. """
-    generateNumbers("input10.txt", 10)
-    generateNumbers("input100.txt", 100)
-    generateNumbers("input1000.txt", 1000)
-    # generateNumbers("input10000000.txt", 10000000)
+    """ Entry point for generating input files from assignment or one large file from command line. """
+    parser = argparse.ArgumentParser(description="Generates random values for profiling, input files from assignment "
+                                                 "without arguments")
+    parser.add_argument("output", nargs="?", help="output file, - for standard output")
+    parser.add_argument("-n", "--count", type=int, default=10 ** 7, help="number of values")
+    parser.add_argument("--seed", type=int, help="seed of random generator")
+    parser.add_argument("--distribution", choices=sorted(DISTRIBUTIONS), default='uniform')
+    parser.add_argument("--format", choices=FORMATS, help="output format, guessed from extension by default")
+    parser.add_argument("--decimals", type=int, default=6, help="digits after decimal point of text format")
+    parser.add_argument("--chunk-size", type=int, default=1 << 20, help="values generated at once")
+    args = parser.parse_args()
 
+    if args.output is None:
+        generateNumbers("input10.txt", 10)
+        generateNumbers("input100.txt", 100)
+        generateNumbers("input1000.txt", 1000)
+    elif np is None:
+        parser.error("generating a file requires numpy")
+    else:
+        generateFile(args.output, args.count, args.seed, args.distribution, args.format or formatOf(args.output),
+                     args.chunk_size, args.decimals)
@@ -19,219 +19,2731 @@
 
 """
 
+import ast
+import atexit
+import bisect
+import copy
+import decimal
+import hashlib
+import json
+import keyword
+import marshal
+import math
+import os
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import types
+from array import array
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from importlib.util import MAGIC_NUMBER
+from itertools import islice
 
-class MathLib:
-    """! Basic math library """
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-    """! class variable - Dict with priorities of operators """
-    operands = {'=': 0, '+': 1, '-': 1, '*': 2, '/': 2, '%': 2, '^': 3, '!': 3, '√': 3}
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
 
-    @staticmethod
-    def add(a, b):
-        """! This function makes addition
+"""! Result of one math problem solved by MathLib.solve_batch, error is None when value is valid """
+BatchResult = namedtuple('BatchResult', ['value', 'error'])
+
+"""! Estimated cost of one expensive operator node, seconds of evaluation and bytes of its result """
+CostNode = namedtuple('CostNode', ['operator', 'digits', 'seconds', 'bytes'])
+
+"""! Estimated cost of whole math problem, digits of its result and list of CostNode of expensive operators """
+CostEstimate = namedtuple('CostEstimate', ['seconds', 'bytes', 'digits', 'nodes'])
 
-        @param a addend
-        @param b addend
-        @pre a is number
-        @pre b is number
-        @return an addition result
 
+class ExpressionCache:
+    """! Bounded LRU cache of compiled math problems """
+
+    def __init__(self, maxsize=4096):
+        """! Constructor of the cache
+        @param maxsize maximal number of stored programs
         """
 
-        return a + b
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._programs = OrderedDict()
 
-    @staticmethod
-    def sub(a, b):
-        """!  This function makes subtraction
+    def __len__(self):
+        return len(self._programs)
 
-        @param a a minuend
-        @param b a subtrahend
-        @pre a is number
-        @pre b is number
-        @return: a subtraction result
+    def get(self, key):
+        """! Looks up a compiled program and marks it as recently used
+        @param key normalized math problem
+        @return compiled program or None when it is not cached
+        """
+
+        program = self._programs.get(key)
+        if program is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._programs.move_to_end(key)
 
+        return program
+
+    def put(self, key, program):
+        """! Stores a compiled program, the least recently used one is evicted when the cache is full
+        @param key normalized math problem
+        @param program compiled program
         """
 
-        return a - b
+        self._programs[key] = program
+        self._programs.move_to_end(key)
+        while len(self._programs) > self.maxsize:
+            self._programs.popitem(last=False)
+            self.evictions += 1
 
-    @staticmethod
-    def mul(a, b):
-        """!  A function for making multiplication
+    def clear(self):
+        """! Removes all programs and resets the counters """
 
-        @param a  a first factor
-        @param b  a second factor
-        @pre a is number
-        @pre b is number
-        @return a multiplication result
+        self._programs.clear()
+        self.hits = self.misses = self.evictions = 0
 
+    def stats(self):
+        """! Returns cache counters
+        @return dict with hits, misses, evictions and current size
         """
 
-        return a * b
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self._programs)}
+
+
+class ResultCache:
+    """! Persistent cache of results of expensive math problems in sqlite database, bounded by bytes of results
+    Keys are hashes of compiled bytecode and backend, so math problems differing only in spaces or in folded
+    constants share one result. Results are stored in binary encoding, the least recently used ones are evicted.
+    """
+
+    def __init__(self, path, budget=256 << 20, min_seconds=0.01):
+        """! Constructor of the cache
+        @param path path to database file
+        @param budget maximal total bytes of stored results
+        @param min_seconds only results computed at least this long are stored
+        """
+
+        self.path = path
+        self.budget = budget
+        self.min_seconds = min_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def connection(self):
+        """! Opens database once per process, connection must not be shared by forked worker processes
+        @return sqlite connection
+        """
+
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False,
+                                               isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, value BLOB NOT NULL, "
+                                     "size INTEGER NOT NULL, used INTEGER NOT NULL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+            self._pid = os.getpid()
+
+        return self._connection
 
     @staticmethod
-    def div(a, b):
-        """!  A function for making division
+    def key(program):
+        """! Computes key of compiled program
+        @param program compiled math problem
+        @return bytes of hash of bytecode, constants and name of backend, None for backend without name
+        """
 
-        @param a  a dividend
-        @param b  a divisor
-        @pre b is not 0
-        @pre a is number
-        @pre b is number
-        @return a division result
+        name = getattr(program.lib, 'name', None)
+        if name is None:
+            return None
+        h = hashlib.sha256()
+        h.update(name.encode())
+        for part in (program.opcodes, program.args, program.floats):
+            h.update(struct.pack("<Q", len(part)))
+            h.update(part.tobytes())
+        for number in program.numbers:
+            h.update(_encodeResult(number) or repr(number).encode())
+
+        return h.digest()
 
+    def get(self, key):
+        """! Looks up result and marks it as recently used
+        @param key key of compiled program
+        @return pair of True and result, or pair of False and None when it is not cached
         """
 
-        " Can't divide by zero "
-        if b == 0:
+        with self._lock:
+            connection = self.connection()
+            row = connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return False, None
+            connection.execute("UPDATE results SET used = (SELECT MAX(used) FROM results) + 1 WHERE key = ?", (key,))
+            self.hits += 1
+
+        return True, _decodeResult(row[0])
+
+    def put(self, key, result, seconds):
+        """! Stores an expensive result, the least recently used results are evicted over the budget
+        @param key key of compiled program
+        @param result result of the program
+        @param seconds time of computation of the result
+        @return True when the result is stored
+        """
+
+        data = _encodeResult(result) if seconds >= self.min_seconds else None
+        if data is None or len(data) > self.budget:
+            return False
+
+        with self._lock:
+            connection = self.connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, "
+                                   "(SELECT IFNULL(MAX(used), 0) + 1 FROM results))", (key, data, len(data)))
+                total = connection.execute("SELECT SUM(size) FROM results").fetchone()[0]
+                for victim, size in connection.execute("SELECT key, size FROM results ORDER BY used").fetchall():
+                    if total <= self.budget:
+                        break
+                    connection.execute("DELETE FROM results WHERE key = ?", (victim,))
+                    total -= size
+                    self.evictions += 1
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+        return True
+
+    def clear(self):
+        """! Removes all results and resets the counters """
+
+        with self._lock:
+            self.connection().execute("DELETE FROM results")
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """! Returns cache counters
+        @return dict with hits, misses, evictions, number of results and their total bytes
+        """
+
+        with self._lock:
+            count, size = self.connection().execute("SELECT COUNT(*), IFNULL(SUM(size), 0) FROM results").fetchone()
+
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': count, 'bytes': size}
+
+
+class Token(namedtuple('Token', ['kind', 'value', 'priority'])):
+    """! Operator or bracket token of the math problem, numbers and variables are tokens on their own
+    Brackets have priority -1, lower than any operator.
+    """
+
+    __slots__ = ()
+
+    """! class variable - kinds of tokens, an operand is completed by a number, variable or kind >= POSTFIX """
+    BINARY, PREFIX, LEFT, POSTFIX, RIGHT = range(5)
+
+
+def _operatorToken(symbol, priority):
+    """! Creates token of operator
+    @param symbol operator
+    @param priority priority of operator
+    @return Token of operator
+    """
+
+    kind = Token.PREFIX if symbol == '~' else Token.POSTFIX if symbol == '!' else Token.BINARY
+    return Token(kind, symbol, priority)
+
+
+class Variable(str):
+    """! Named variable in postfix notation of the math problem """
+
+    def __repr__(self):
+        return "Variable(%s)" % str.__repr__(self)
+
+
+class Node:
+    """! Node of expression tree, identical subtrees are one shared node """
+
+    __slots__ = ('operator', 'args', 'value', 'type', 'uses')
+
+    def __init__(self, operator, args=(), value=None, type=None):
+        """! Constructor of the node
+        @param operator operator symbol, None for a number or a variable
+        @param args tuple of operand nodes
+        @param value number or Variable of a leaf node
+        @param type int or float when the type of result is known in advance, None otherwise
+        """
+
+        self.operator = operator
+        self.args = args
+        self.value = value
+        self.type = type
+        self.uses = 0
+
+    def isConstant(self):
+        """! Checks whether the node is a number
+        @return True for a number
+        """
+
+        return self.operator is None and not isinstance(self.value, Variable)
+
+
+class TreeBuilder:
+    """! Builds expression tree from postfix notation.
+    When optimizing, identical subtrees are shared, constant subtrees are folded and safe algebraic
+    simplifications are applied (x * 1, x / 1, x - 0 and x ^ 1 for float x, double unary minus). Power and
+    factorial reduced by modulo are fused into operators '^%' and '!%'.
+    """
+
+    """! class variable - Constant power and factorial with more digits are not folded, they may be reduced later """
+    fold_digits = 10000
+
+    def __init__(self, optimize=True, lib=None):
+        """! Constructor of the builder
+        @param optimize whether the tree is optimized
+        @param lib numeric backend folding constants, MathLib by default
+        """
+
+        self.optimize = optimize
+        self.lib = MathLib if lib is None else lib
+        self.nodes = {}
+
+    def build(self, postfix):
+        """! Builds tree of postfix notation
+        @param postfix postfix notation of the math problem
+        @pre all operators in postfix are supported by MathLib.solve
+        @return root node, uses of all nodes are counted
+        """
+
+        s = [self.constant(self.lib.number("0.0"))]
+        for x in postfix:
+            if isinstance(x, Variable):
+                s.append(self.leaf(Node(None, value=x)))
+            elif x not in MathLib.operands:
+                s.append(self.constant(x))
+            elif x in MathLib.functions:
+                b = s.pop()
+                s.append(self.operator(x, (b,) if x in MathLib.unary else (s.pop(), b)))
+            else:
+                raise ValueError("Exception")
+
+        root = s[-1]
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            node.uses += 1
+            if node.uses == 1:
+                stack.extend(node.args)
+
+        return root
+
+    def leaf(self, node):
+        """! Shares leaf node
+        @param node number or variable node
+        @return the same node or its earlier equal
+        """
+
+        if not self.optimize:
+            return node
+
+        # Type is a part of the key, 1 and 1.0 are different constants and so are 0.0 and -0.0
+        key = (type(node.value), node.value, math.copysign(1, node.value) if isinstance(node.value, float) else 0)
+        return self.nodes.setdefault(key, node)
+
+    def constant(self, value):
+        """! Creates number node
+        @param value number
+        @return node
+        """
+
+        return self.leaf(Node(None, value=value, type=type(value) if type(value) in (int, float) else None))
+
+    def operator(self, x, args):
+        """! Creates operator node
+        @param x operator
+        @param args tuple of operand nodes
+        @return node, possibly folded or simplified
+        """
+
+        if not self.optimize:
+            return Node(x, args, type=_resultType(x, args))
+
+        if x == '%' and args[0].operator == '^':
+            return self.operator('^%', args[0].args + args[1:])
+        if x == '%' and args[0].operator == '!':
+            return self.operator('!%', args[0].args + args[1:])
+
+        key = (x,) + tuple(id(arg) for arg in args)
+        node = self.nodes.get(key)
+        if node is None:
+            node = self.simplify(x, args) or Node(x, args, type=_resultType(x, args))
+            self.nodes[key] = node
+
+        return node
+
+    def simplify(self, x, args):
+        """! Folds constants and applies safe algebraic simplifications
+        @param x operator
+        @param args tuple of operand nodes
+        @return simplified node or None when nothing can be simplified
+        """
+
+        if all(arg.isConstant() for arg in args) and not self.huge(x, args):
+            function = getattr(self.lib, MathLib.functions[x])
+            if self.lib is MathLib and MathLib.instrumentation is not None:
+                function = MathLib.instrumentation.functions[MathLib.functions[x]]
+            try:
+                return self.constant(function(*(arg.value for arg in args)))
+            except Exception:
+                # The error is raised when the program runs
+                return None
+
+        a, b = args[0], args[-1]
+        if x == '~' and a.operator == '~':
+            return a.args[0]
+        if a.type is float and b.isConstant() and ((x in ('*', '/', '^') and b.value == 1) or
+                                                   (x == '-' and b.value == 0)):
+            return a
+        if x == '*' and b.type is float and a.isConstant() and a.value == 1:
+            return b
+
+        return None
+
+    def huge(self, x, args):
+        """! Checks whether constant power or factorial has too many digits to be folded
+        @param x operator
+        @param args tuple of constant operand nodes
+        @return True when the result has more than fold_digits digits
+        """
+
+        if x != '^' and x != '!':
+            return False
+
+        estimates = [_constantEstimate(arg.value) for arg in args]
+        lg = _estimateOperator(x, estimates[0] if x == '^' else None, estimates[-1])[0]
+        return lg >= TreeBuilder.fold_digits
+
+
+def _resultType(x, args):
+    """! Infers type of operator result
+    @param x operator
+    @param args tuple of operand nodes
+    @return int or float when it is known in advance, None otherwise
+    """
+
+    types = [arg.type for arg in args]
+    if x == '!':
+        return int
+    if x == '!%':
+        # Factorial is integer
+        types[0] = int
+    if None in types or x == '√':
+        # Root of a negative number is complex
+        return None
+    if x == '/' or float in types:
+        return float
+
+    return int
+
+
+class Program:
+    """! Compiled math problem - expression tree linearized into compact bytecode for a stack machine
+    Shared operator subtrees are evaluated once, their results are kept in slots. Operands of the bytecode are read
+    in order from separate pools: floats, other numbers and indexes of variables or slots.
+    """
+
+    """! class variable - Opcodes without operator, the following opcodes are operators """
+    FLOAT, NUMBER, VARIABLE, STORE, LOAD = range(5)
+
+    """! class variable - Operators in order of their opcodes, ternary operator first, then unary and binary """
+    operators = ('^%', '~', '!', '+', '-', '*', '/', '%', '^', '√', '!%')
+
+    """! class variable - The first opcode of unary operator """
+    UNARY = LOAD + 2
+
+    """! class variable - The first opcode of binary operator """
+    BINARY = LOAD + 4
+
+    __slots__ = ('expression', 'postfix', 'lib', 'tree', 'variables', 'opcodes', 'args', 'floats', 'numbers', 'slots',
+                 'depth', '_tables')
+
+    def __init__(self, expression, postfix, optimize=True, lib=None):
+        """! Constructor of the program
+        @param expression normalized math problem
+        @param postfix postfix notation of the math problem
+        @param optimize whether the expression tree is optimized
+        @param lib numeric backend of numbers in postfix, MathLib by default
+        @pre all operators in postfix are supported by MathLib.solve
+        """
+
+        self.expression = expression
+        self.postfix = postfix
+        self.lib = MathLib if lib is None else lib
+        self.tree = TreeBuilder(optimize, self.lib).build(postfix)
+        self.variables = tuple(OrderedDict.fromkeys(x for x in postfix if isinstance(x, Variable)))
+        self._tables = {}
+        self.assemble()
+
+    def assemble(self):
+        """! Linearizes the expression tree into bytecode, computes number of slots and maximal depth of stack """
+
+        opcodes = self.opcodes = array('B')
+        args = self.args = array('I')
+        floats = self.floats = array('d')
+        self.numbers = []
+        variables = {x: i for i, x in enumerate(self.variables)}
+        opcode = {x: i for i, x in enumerate(Program.operators, Program.LOAD + 1)}
+        slots = {}
+        depth = self.depth = 0
+
+        # Iterative post-order traversal, trees of long math problems are too deep for recursion
+        stack = [(self.tree, False)]
+        while stack:
+            node, ready = stack.pop()
+            if not ready:
+                if node in slots:
+                    opcodes.append(Program.LOAD)
+                    args.append(slots[node])
+                    depth += 1
+                    continue
+                if node.operator is not None:
+                    stack.append((node, True))
+                    stack.extend((arg, False) for arg in reversed(node.args))
+                    continue
+                if isinstance(node.value, Variable):
+                    opcodes.append(Program.VARIABLE)
+                    args.append(variables[node.value])
+                elif type(node.value) is float:
+                    opcodes.append(Program.FLOAT)
+                    floats.append(node.value)
+                else:
+                    opcodes.append(Program.NUMBER)
+                    self.numbers.append(node.value)
+                depth += 1
+            else:
+                opcodes.append(opcode[node.operator])
+                depth -= len(node.args) - 1
+            self.depth = max(self.depth, depth)
+            if node.uses > 1 and node.operator is not None:
+                opcodes.append(Program.STORE)
+                args.append(slots.setdefault(node, len(slots)))
+
+        self.slots = len(slots)
+
+    def table(self, lib):
+        """! Resolves operators to functions of the given library
+        @param lib class implementing operators under names from MathLib.functions
+        @return list of functions indexed by opcode, None for opcodes without operator
+        """
+
+        table = self._tables.get(lib)
+        if table is None:
+            table = [None] * (Program.LOAD + 1) + [getattr(lib, MathLib.functions[x]) for x in Program.operators]
+            self._tables[lib] = table
+
+        return table
+
+    def run(self, variables=None, lib=None):
+        """! Evaluates the program
+        @param variables dict with values of variables
+        @param lib class implementing operators, the backend of the program is used by default
+        @return result of the math problem, integral floats are not converted
+        """
+
+        if variables is None:
+            variables = {}
+        try:
+            values = [variables[x] for x in self.variables]
+        except KeyError:
+            # Unbound variable
             raise ValueError("Exception")
 
-        return a / b
+        lib = self.lib if lib is None else lib
+        if lib is MathLib and MathLib.instrumentation is not None:
+            table = MathLib.instrumentation.table
+        else:
+            table = self.table(lib)
+        binary = Program.BINARY
+        unary = Program.UNARY
+        floats = iter(self.floats).__next__
+        numbers = iter(self.numbers).__next__
+        args = iter(self.args).__next__
+        slots = [None] * self.slots
+        s = [None] * self.depth
+        i = 0
+        for opcode in self.opcodes:
+            if opcode >= binary:
+                i -= 1
+                s[i - 1] = table[opcode](s[i - 1], s[i])
+            elif not opcode:
+                s[i] = floats()
+                i += 1
+            elif opcode >= unary:
+                s[i - 1] = table[opcode](s[i - 1])
+            elif opcode == Program.NUMBER:
+                s[i] = numbers()
+                i += 1
+            elif opcode == Program.VARIABLE:
+                s[i] = values[args()]
+                i += 1
+            elif opcode == Program.STORE:
+                slots[args()] = s[i - 1]
+            elif opcode == Program.LOAD:
+                s[i] = slots[args()]
+                i += 1
+            else:
+                i -= 2
+                s[i - 1] = table[opcode](s[i - 1], s[i], s[i + 1])
+
+        return s[0]
+
+    def dump(self):
+        """! Formats the expression tree for debugging, shared subtrees are printed once and then referenced by #n
+        @return text with one node per line, operands are indented under their operator
+        """
+
+        lines = []
+        labels = {}
+        stack = [(self.tree, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if node in labels:
+                lines.append("  " * depth + "#%d" % labels[node])
+                continue
+
+            if node.operator is not None:
+                text = node.operator
+            elif isinstance(node.value, int) and node.value.bit_length() > 64:
+                text = "<%d-bit integer>" % node.value.bit_length()
+            else:
+                text = repr(node.value)
+            if node.uses > 1 and node.operator is not None:
+                labels[node] = len(labels) + 1
+                text += "  #%d" % labels[node]
+            lines.append("  " * depth + text)
+            stack.extend((arg, depth + 1) for arg in reversed(node.args))
+
+        return "\n".join(lines)
+
+
+class ArrayMath:
+    """! Array-aware versions of MathLib operators working element-wise over NumPy arrays
+    Invalid elements (division by zero, non-natural exponent, ...) make the whole operation fail.
+    Constants are folded by these operators too, so they overflow to infinity like the arrays do.
+    """
+
+    """! class variable - Conversion of number literals """
+    number = float
+
+    """! class variable - Name of the backend """
+    name = "array"
+
+    """! class variable - Factorials representable in float64, larger ones are infinite """
+    factorials = None
 
     @staticmethod
-    def mod(a, b):
-        """! This function makes modulo
+    def add(a, b):
+        """! Element-wise addition """
 
-        @param a  a dividend
-        @param b  a divisor
-        @pre b is not 0
-        @pre a is number
-        @pre b is number
-        @return a modulo result
+        return np.add(a, b)
 
-        """
+    @staticmethod
+    def sub(a, b):
+        """! Element-wise subtraction """
+
+        return np.subtract(a, b)
+
+    @staticmethod
+    def mul(a, b):
+        """! Element-wise multiplication """
+
+        return np.multiply(a, b)
+
+    @staticmethod
+    def neg(a):
+        """! Element-wise negation """
+
+        return np.negative(a)
+
+    @staticmethod
+    def div(a, b):
+        """! Element-wise division, fails when any divisor is 0 """
 
         # Can't divide by zero
-        if b == 0:
+        if np.any(np.equal(b, 0)):
             raise ValueError("Exception")
 
-        return a % b
+        return np.true_divide(a, b)
 
     @staticmethod
-    def fact(a):
-        """! This function makes factorial
+    def mod(a, b):
+        """! Element-wise modulo, fails when any divisor is 0 """
 
-        @param a natural number for factorial
-        @pre a is natural integer
-        @return a factorial result
+        # Can't divide by zero
+        if np.any(np.equal(b, 0)):
+            raise ValueError("Exception")
 
-        """
+        return np.mod(a, b)
+
+    @staticmethod
+    def fact(a):
+        """! Element-wise factorial, fails when any element is not a natural integer """
 
-        if (isinstance(a, float) and not a.is_integer()) or a < 0:
+        if np.any((np.less(a, 0)) | (np.floor(a) != a)):
             raise ValueError("Exception")
 
-        result = 1
-        for i in range(2, int(a) + 1):
-            result *= i
+        if ArrayMath.factorials is None:
+            ArrayMath.factorials = np.concatenate(([1.0], np.cumprod(np.arange(1, 171, dtype=np.float64))))
 
-        return result
+        table = ArrayMath.factorials
+        # Indexing by () turns result for a scalar into a scalar, arrays are kept
+        return np.where(np.greater(a, len(table) - 1), np.inf,
+                        table[np.minimum(a, len(table) - 1).astype(np.intp)])[()]
 
     @staticmethod
     def root(x, n):
-        """! A function for making root
-
-        @param x base root
-        @param n an exponent
-        @pre n is not 0
-        @pre x is number
-        @pre n is number
-        @return a root result
-
-        """
+        """! Element-wise root, fails when any exponent is 0 """
 
         # Can't divide by zero
-        if n == 0:
+        if np.any(np.equal(n, 0)):
             raise ValueError("Exception")
 
-        return x ** (1 / n)
+        return np.power(x, np.true_divide(1, n))
 
     @staticmethod
     def pow(x, n):
-        """! A function for making power
+        """! Element-wise power, fails when any exponent is not a natural integer """
 
-        @param x base power
-        @param n an exponent
-        @pre x is number
-        @pre n is natural integer
-        @return a power result
+        if np.any((np.less(n, 0)) | (np.floor(n) != n)):
+            raise ValueError("Exception")
 
-        """
+        return np.power(x, n)
 
-        if (isinstance(n, float) and not n.is_integer()) or n < 0:
-            raise ValueError("Exception")
+    @staticmethod
+    def powmod(x, n, m):
+        """! Element-wise power reduced by modulo, computed unfused """
 
-        # Changed after profiling, but it has actually worse timing than the original one
-        # result = 1
-        # for i in range(0, int(n)):
-        #     result *= x
-        #
-        # return result
-        return x ** n
+        return ArrayMath.mod(ArrayMath.pow(x, n), m)
 
     @staticmethod
-    def parse(equation):
-        """! A function for parsing
-        @param equation string with math problem
-        @pre equation is entered correctly and members are separated by space
-        @return postfix notation of equation in list
-        """
+    def factmod(a, m):
+        """! Element-wise factorial reduced by modulo, computed unfused """
 
-        s = []
-        postfix = []
-        for x in equation.split():
-            if x == ')':
-                while s[-1] != '(':
-                    postfix.append(s.pop())
-                s.pop()
-            elif x == '(':
-                s.append('(')
-            elif x not in MathLib.operands.keys():
-                postfix.append(float(x))
-            else:
-                while not (not len(s) or s[-1] == '(' or MathLib.operands[s[-1]] < MathLib.operands[x]):
-                    postfix.append(s.pop())
-                s.append(x)
+        return ArrayMath.mod(ArrayMath.fact(a), m)
 
-        while len(s):
-            postfix.append(s.pop())
 
-        return postfix
+class FractionMath:
+    """! Operators of exact fractions.Fraction numbers, only root of other than perfect powers is not exact """
+
+    """! class variable - Conversion of number literals """
+    number = Fraction
+
+    """! class variable - Name of the backend """
+    name = "fraction"
 
     @staticmethod
-    def solve(equation):
-        """! A function for solving the math problem
-        @param equation string with math problem
-        @pre equation is entered correctly and members are separated by space
-        @return result of equation
-        """
+    def add(a, b):
+        """! Exact addition """
+
+        return a + b
+
+    @staticmethod
+    def sub(a, b):
+        """! Exact subtraction """
+
+        return a - b
+
+    @staticmethod
+    def mul(a, b):
+        """! Exact multiplication """
+
+        return a * b
+
+    @staticmethod
+    def neg(a):
+        """! Exact negation """
+
+        return -a
+
+    @staticmethod
+    def div(a, b):
+        """! Exact division, fails when divisor is 0 """
+
+        # Can't divide by zero
+        if b == 0:
+            raise ValueError("Exception")
+
+        return Fraction(a) / b
+
+    @staticmethod
+    def mod(a, b):
+        """! Exact modulo, fails when divisor is 0 """
+
+        # Can't divide by zero
+        if b == 0:
+            raise ValueError("Exception")
+
+        return Fraction(a) % b
+
+    @staticmethod
+    def fact(a):
+        """! Factorial, fails when argument is not a natural integer """
+
+        if a < 0 or Fraction(a).denominator != 1:
+            raise ValueError("Exception")
+
+        return Fraction(MathLib.fact(int(a)))
+
+    @staticmethod
+    def root(x, n):
+        """! Root in floating point, fails when exponent is 0 """
+
+        # Can't divide by zero
+        if n == 0:
+            raise ValueError("Exception")
+
+        x = Fraction(x)
+        if x >= 0 and Fraction(n).denominator == 1:
+            # Root of a fraction of perfect powers is exact
+            k = abs(int(n))
+            root = Fraction(_integerRoot(x.numerator, k), _integerRoot(x.denominator, k))
+            if root ** k == x:
+                return root if n > 0 else 1 / root
+
+        return x ** (1 / Fraction(n))
+
+    @staticmethod
+    def pow(x, n):
+        """! Exact power, fails when exponent is not a natural integer """
+
+        if n < 0 or Fraction(n).denominator != 1:
+            raise ValueError("Exception")
+
+        return Fraction(x) ** int(n)
+
+    @staticmethod
+    def powmod(x, n, m):
+        """! Exact power reduced by modulo, reduced as you go when base and modulus are integers """
+
+        if n < 0 or Fraction(n).denominator != 1:
+            raise ValueError("Exception")
+        # Can't divide by zero
+        if m == 0:
+            raise ValueError("Exception")
+
+        if Fraction(x).denominator == 1 and Fraction(m).denominator == 1:
+            return Fraction(pow(int(x), int(n), int(m)))
+
+        return FractionMath.mod(FractionMath.pow(x, n), m)
+
+    @staticmethod
+    def factmod(a, m):
+        """! Exact factorial reduced by modulo, reduced as you go when modulus is integer """
+
+        if a < 0 or Fraction(a).denominator != 1:
+            raise ValueError("Exception")
+        # Can't divide by zero
+        if m == 0:
+            raise ValueError("Exception")
+
+        if Fraction(m).denominator == 1:
+            return Fraction(_factorialMod(int(a), int(m)))
+
+        return FractionMath.mod(FractionMath.fact(a), m)
+
+
+class DecimalMath:
+    """! Operators of decimal.Decimal numbers rounded to given number of significant digits """
+
+    def __init__(self, precision=28):
+        """! Constructor of the backend
+        @param precision number of significant digits
+        """
+
+        self.context = decimal.Context(prec=precision)
+        self.name = "decimal:%d" % precision
+
+    def number(self, text):
+        """! Converts number literal rounded to the precision, fails with ValueError for other text """
+
+        try:
+            return self.context.create_decimal(text)
+        except decimal.InvalidOperation:
+            raise ValueError("Exception")
+
+    def add(self, a, b):
+        """! Rounded addition """
+
+        return self.context.add(a, b)
+
+    def sub(self, a, b):
+        """! Rounded subtraction """
+
+        return self.context.subtract(a, b)
+
+    def mul(self, a, b):
+        """! Rounded multiplication """
+
+        return self.context.multiply(a, b)
+
+    def neg(self, a):
+        """! Negation """
+
+        return self.context.minus(a)
+
+    def div(self, a, b):
+        """! Rounded division, fails when divisor is 0 """
+
+        # Can't divide by zero
+        if b == 0:
+            raise ValueError("Exception")
+
+        return self.context.divide(a, b)
+
+    def mod(self, a, b):
+        """! Modulo with sign of divisor like float modulo, fails when divisor is 0 """
+
+        # Can't divide by zero
+        if b == 0:
+            raise ValueError("Exception")
+
+        try:
+            result = self.context.remainder(a, b)
+        except decimal.InvalidOperation:
+            # Quotient has more digits than the precision
+            raise ValueError("Exception")
+        if result and (result < 0) != (b < 0):
+            result = self.context.add(result, b)
+
+        return result
+
+    def fact(self, a):
+        """! Rounded factorial, fails when argument is not a natural integer """
+
+        a = self.context.create_decimal(a)
+        if a < 0 or a != a.to_integral_value():
+            raise ValueError("Exception")
+
+        return self.context.create_decimal(MathLib.fact(int(a)))
+
+    def root(self, x, n):
+        """! Rounded root, fails when exponent is 0 or result is not real """
+
+        # Can't divide by zero
+        if n == 0:
+            raise ValueError("Exception")
+
+        try:
+            return self.context.power(x, self.context.divide(1, n))
+        except decimal.InvalidOperation:
+            raise ValueError("Exception")
+
+    def pow(self, x, n):
+        """! Rounded power, fails when exponent is not a natural integer """
+
+        n = self.context.create_decimal(n)
+        if n < 0 or n != n.to_integral_value():
+            raise ValueError("Exception")
+
+        return self.context.power(x, n)
+
+    def powmod(self, x, n, m):
+        """! Rounded power reduced by modulo, computed unfused to keep the rounding """
+
+        return self.mod(self.pow(x, n), m)
+
+    def factmod(self, a, m):
+        """! Rounded factorial reduced by modulo, computed unfused to keep the rounding """
+
+        return self.mod(self.fact(a), m)
+
+
+class GmpyMath:
+    """! Operators of gmpy2 numbers, integers are mpz and the other numbers are mpfr
+    @pre gmpy2 is installed
+    """
+
+    """! class variable - Name of the backend, mpfr numbers are assumed to use the default precision of gmpy2 """
+    name = "gmpy2"
+
+    @staticmethod
+    def number(text):
+        """! Converts integer literal to mpz and other literal to mpfr """
+
+        try:
+            return gmpy2.mpz(text)
+        except ValueError:
+            return gmpy2.mpfr(text)
+
+    @staticmethod
+    def add(a, b):
+        """! Addition """
+
+        return a + b
+
+    @staticmethod
+    def sub(a, b):
+        """! Subtraction """
+
+        return a - b
+
+    @staticmethod
+    def mul(a, b):
+        """! Multiplication """
+
+        return a * b
+
+    @staticmethod
+    def neg(a):
+        """! Negation """
+
+        return -a
+
+    @staticmethod
+    def div(a, b):
+        """! Division, fails when divisor is 0 """
+
+        # Can't divide by zero
+        if b == 0:
+            raise ValueError("Exception")
+
+        return a / b
+
+    @staticmethod
+    def mod(a, b):
+        """! Modulo, fails when divisor is 0 """
+
+        # Can't divide by zero
+        if b == 0:
+            raise ValueError("Exception")
+
+        return a % b
+
+    @staticmethod
+    def fact(a):
+        """! Factorial of GMP, fails when argument is not a natural integer """
+
+        if a < 0 or not gmpy2.is_integer(a):
+            raise ValueError("Exception")
+
+        return gmpy2.fac(int(a))
+
+    @staticmethod
+    def root(x, n):
+        """! Root, fails when exponent is 0 """
+
+        # Can't divide by zero
+        if n == 0:
+            raise ValueError("Exception")
+
+        if gmpy2.is_integer(x) and x >= 0 and gmpy2.is_integer(n):
+            # Perfect power gives exact mpz
+            root, exact = gmpy2.iroot(gmpy2.mpz(x), abs(int(n)))
+            if exact:
+                return root if n > 0 else 1 / gmpy2.mpfr(root)
+
+        return x ** (1 / gmpy2.mpfr(n))
+
+    @staticmethod
+    def pow(x, n):
+        """! Power, fails when exponent is not a natural integer """
+
+        if n < 0 or not gmpy2.is_integer(n):
+            raise ValueError("Exception")
+
+        return x ** int(n)
+
+    @staticmethod
+    def powmod(x, n, m):
+        """! Power reduced by modulo, powmod of GMP when base and modulus are integers """
+
+        if n < 0 or not gmpy2.is_integer(n):
+            raise ValueError("Exception")
+        # Can't divide by zero
+        if m == 0:
+            raise ValueError("Exception")
+
+        if gmpy2.is_integer(x) and gmpy2.is_integer(m):
+            result = gmpy2.powmod(gmpy2.mpz(x), gmpy2.mpz(n), abs(gmpy2.mpz(m)))
+            # Sign of the result follows the modulus like in Python
+            return result + m if m < 0 and result else result
+
+        return GmpyMath.mod(GmpyMath.pow(x, n), m)
+
+    @staticmethod
+    def factmod(a, m):
+        """! Factorial reduced by modulo, reduced as you go when modulus is integer """
+
+        if a < 0 or not gmpy2.is_integer(a):
+            raise ValueError("Exception")
+        # Can't divide by zero
+        if m == 0:
+            raise ValueError("Exception")
+
+        if gmpy2.is_integer(m):
+            return gmpy2.mpz(_factorialMod(int(a), int(m)))
+
+        return GmpyMath.mod(GmpyMath.fact(a), m)
+
+
+class RunningStats:
+    """! Numerically stable running mean and variance (Welford's algorithm) with O(1) memory
+    Summaries of separate parts of data can be merged by the pairwise formula of Chan et al.
+    """
+
+    __slots__ = ('n', '_mean', '_m2')
+
+    def __init__(self):
+        """! Constructor of empty summary """
+
+        self.n = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def push(self, x):
+        """! Adds one value
+        @param x number
+        """
+
+        self.n += 1
+        delta = x - self._mean
+        self._mean += delta / self.n
+        self._m2 += delta * (x - self._mean)
+
+    def push_many(self, values):
+        """! Adds many values, a NumPy array is summarized vectorized and merged at once
+        @param values array or iterable of numbers
+        """
+
+        if np is None:
+            for x in values:
+                self.push(x)
+            return
+
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not values.size:
+            return
+
+        block = RunningStats()
+        block.n = values.size
+        block._mean = float(values.mean())
+        deviations = values - block._mean
+        block._m2 = float(np.dot(deviations, deviations))
+        self.merge(block)
+
+    def merge(self, other):
+        """! Adds all values summarized by other running stats
+        @param other summary of other values
+        @return self
+        """
+
+        if not other.n:
+            return self
+        if not self.n:
+            self.n, self._mean, self._m2 = other.n, other._mean, other._m2
+            return self
+
+        n = self.n + other.n
+        delta = other._mean - self._mean
+        self._mean += delta * other.n / n
+        self._m2 += other._m2 + delta * delta * self.n * other.n / n
+        self.n = n
+
+        return self
+
+    @property
+    def mean(self):
+        """! Mean of values
+        @pre at least one value was added
+        @return mean
+        """
+
+        if not self.n:
+            raise ValueError("Exception")
+
+        return self._mean
+
+    @property
+    def variance(self):
+        """! Selective variance of values
+        @pre at least two values were added
+        @return variance
+        """
+
+        if self.n < 2:
+            raise ValueError("Exception")
+
+        return self._m2 / (self.n - 1)
+
+    @property
+    def stdev(self):
+        """! Selective standard deviation of values
+        @pre at least two values were added
+        @return standard deviation
+        """
+
+        return math.sqrt(self.variance)
+
+
+class OperatorStats:
+    """! Calls, time and sizes of big integer results of one operator or phase """
+
+    __slots__ = ('calls', 'seconds', 'errors', 'bigints', 'bits', 'max_bits')
+
+    def __init__(self):
+        """! Constructor of empty statistics """
+
+        self.calls = 0
+        self.seconds = 0.0
+        self.errors = 0
+        self.bigints = 0
+        self.bits = 0
+        self.max_bits = 0
+
+    def add(self, seconds, result=None):
+        """! Records one call
+        @param seconds wall time of the call
+        @param result result of the call, integers wider than 64 bits are counted with their size
+        """
+
+        self.calls += 1
+        self.seconds += seconds
+        if type(result) is int:
+            bits = result.bit_length()
+            if bits > 64:
+                self.bigints += 1
+                self.bits += bits
+                self.max_bits = max(self.max_bits, bits)
+
+    def asdict(self):
+        """! Converts statistics to dict
+        @return dict with all fields
+        """
+
+        return {name: getattr(self, name) for name in OperatorStats.__slots__}
+
+
+class Instrumentation:
+    """! Opt-in statistics of operators and phases of MathLib.solve
+    It is enabled by the context manager or by environment variable MATHLIB_INSTRUMENT with path of file, where the
+    statistics are saved at exit. Operators are instrumented in constant folding and in Program.run with the default
+    library, so the disabled instrumentation costs one check per evaluated program, not per operator.
+    """
+
+    def __init__(self):
+        """! Constructor of empty statistics """
+
+        self.operators = {name: OperatorStats() for name in MathLib.functions.values()}
+        self.phases = {name: OperatorStats() for name in ('parse', 'compile', 'solve')}
+        self.functions = {name: self.wrap(name) for name in self.operators}
+        self.table = [None] * (Program.LOAD + 1) + [self.functions[MathLib.functions[x]] for x in Program.operators]
+        self._previous = []
+
+    def __enter__(self):
+        self._previous.append(MathLib.instrumentation)
+        MathLib.instrumentation = self
+        return self
+
+    def __exit__(self, *exception):
+        MathLib.instrumentation = self._previous.pop()
+
+    def wrap(self, name):
+        """! Creates function of MathLib measuring its calls
+        @param name name of MathLib function
+        @return the measuring function
+        """
+
+        function = getattr(MathLib, name)
+        stats = self.operators[name]
+        clock = time.perf_counter
+
+        def instrumented(*args):
+            start = clock()
+            try:
+                result = function(*args)
+            except Exception:
+                stats.errors += 1
+                raise
+            stats.add(clock() - start, result)
+            return result
+
+        return instrumented
+
+    def record(self, phase, seconds):
+        """! Records one phase of solving
+        @param phase name of the phase, parse, compile or solve
+        @param seconds wall time of the phase
+        """
+
+        self.phases[phase].add(seconds)
+
+    def to_json(self):
+        """! Exports statistics
+        @return JSON text with operators and phases
+        """
+
+        return json.dumps({'operators': {name: stats.asdict() for name, stats in self.operators.items()},
+                           'phases': {name: stats.asdict() for name, stats in self.phases.items()}}, indent=1)
+
+    def to_prometheus(self):
+        """! Exports statistics in text format of Prometheus
+        @return text with counters of operators and phases
+        """
+
+        metrics = (('calls_total', 'counter', "Number of calls"),
+                   ('seconds_total', 'counter', "Total wall time in seconds"),
+                   ('errors_total', 'counter', "Number of calls raising an exception"),
+                   ('bigint_results_total', 'counter', "Number of integer results wider than 64 bits"),
+                   ('bigint_bits_total', 'counter', "Total bits of integer results wider than 64 bits"),
+                   ('bigint_bits_max', 'gauge', "Bits of the widest integer result"))
+        lines = []
+        for kind, label, group in (('operator', 'operator', self.operators), ('phase', 'phase', self.phases)):
+            for (metric, metricType, help), field in zip(metrics, OperatorStats.__slots__):
+                name = "mathlib_%s_%s" % (kind, metric)
+                lines.append("# HELP %s %s" % (name, help))
+                lines.append("# TYPE %s %s" % (name, metricType))
+                for key, stats in group.items():
+                    lines.append('%s{%s="%s"} %r' % (name, label, key, getattr(stats, field)))
+
+        return "\n".join(lines) + "\n"
+
+    def save(self, path):
+        """! Saves statistics, format is chosen by extension, .prom for Prometheus and JSON otherwise
+        @param path path to file, - for standard error output
+        """
+
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        if path == "-":
+            sys.stderr.write(text)
+        else:
+            with open(path, "w") as f:
+                f.write(text)
+
+
+class MathLib:
+    """! Basic math library """
+
+    """! class variable - Dict with priorities of operators, '~' is unary minus """
+    operands = {'=': 0, '+': 1, '-': 1, '*': 2, '/': 2, '%': 2, '~': 3, '^': 4, '!': 4, '√': 4}
+
+    """! class variable - Dict with names of functions implementing operators """
+    functions = {'+': 'add', '-': 'sub', '*': 'mul', '/': 'div', '%': 'mod', '√': 'root', '^': 'pow', '!': 'fact',
+                 '~': 'neg', '^%': 'powmod', '!%': 'factmod'}
+
+    """! class variable - Set of operators taking only one argument """
+    unary = {'!', '~'}
+
+    """! class variable - Dict with tokens of operators and brackets, created once from priorities """
+    tokens = {symbol: _operatorToken(symbol, priority) for symbol, priority in operands.items()}
+    tokens['('] = Token(Token.LEFT, '(', -1)
+    tokens[')'] = Token(Token.RIGHT, ')', -1)
+
+    """! class variable - Cache of compiled math problems used by solve """
+    cache = ExpressionCache()
+
+    """! class variable - Conversion of number literals, this default backend computes in floats """
+    number = float
+
+    """! class variable - Name of the backend, stable across processes, used in keys of ResultCache """
+    name = "float"
+
+    """! class variable - Numeric backends by name, each converts literals by its number and implements operators,
+    its name attribute identifies it together with its settings
+    """
+    backends = {}
+
+    """! class variable - Persistent ResultCache used by solve, None when it is disabled """
+    result_cache = None
+
+    """! class variable - Active Instrumentation, None when it is disabled """
+    instrumentation = None
+
+    """! class variable - Directory with marshalled functions of to_function, None disables the on-disk cache """
+    function_cache = None
+
+    """! class variable - Memo of computed factorials, fact continues from the nearest smaller one """
+    fact_memo = {}
+
+    """! class variable - Maximal total size of memoized factorials in bytes, bigger factorials are not memoized """
+    fact_memo_budget = 32 << 20
+
+    """! class variable - Factorials of smaller numbers are not memoized, they are cheap """
+    fact_memo_min = 1000
+
+    """! class variable - Estimated seconds of evaluation of one token of postfix notation """
+    cost_per_token = 2e-7
+
+    """! class variable - Big integer operation with d digit result takes about coefficient * d ^ exponent seconds """
+    cost_coefficients = {'*': 4e-10, '/': 4e-10, '%': 4e-10, '^': 1.3e-10, '!': 2.8e-10}
+
+    """! class variable - Exponent of big integer multiplication complexity (Karatsuba) """
+    cost_exponent = 1.585
+
+    """! class variable - Seconds of multiplication of big integer by small one and its reduction, per digit """
+    cost_per_digit = 7e-11
+
+    @staticmethod
+    def add(a, b):
+        """! This function makes addition
+
+        @param a addend
+        @param b addend
+        @pre a is number
+        @pre b is number
+        @return an addition result
+
+        """
+
+        return a + b
+
+    @staticmethod
+    def sub(a, b):
+        """!  This function makes subtraction
+
+        @param a a minuend
+        @param b a subtrahend
+        @pre a is number
+        @pre b is number
+        @return: a subtraction result
+
+        """
+
+        return a - b
+
+    @staticmethod
+    def mul(a, b):
+        """!  A function for making multiplication
+
+        @param a  a first factor
+        @param b  a second factor
+        @pre a is number
+        @pre b is number
+        @return a multiplication result
+
+        """
+
+        return a * b
+
+    @staticmethod
+    def neg(a):
+        """!  A function for making negation
+
+        @param a number
+        @pre a is number
+        @return a negated number
+
+        """
+
+        return -a
+
+    @staticmethod
+    def div(a, b):
+        """!  A function for making division
+
+        @param a  a dividend
+        @param b  a divisor
+        @pre b is not 0
+        @pre a is number
+        @pre b is number
+        @return a division result
+
+        """
+
+        " Can't divide by zero "
+        if b == 0:
+            raise ValueError("Exception")
+
+        return a / b
+
+    @staticmethod
+    def mod(a, b):
+        """! This function makes modulo
+
+        @param a  a dividend
+        @param b  a divisor
+        @pre b is not 0
+        @pre a is number
+        @pre b is number
+        @return a modulo result
+
+        """
+
+        # Can't divide by zero
+        if b == 0:
+            raise ValueError("Exception")
+
+        return a % b
+
+    @staticmethod
+    def fact(a):
+        """! This function makes factorial
+
+        @param a natural number for factorial
+        @pre a is natural integer
+        @return a factorial result
+
+        """
+
+        if isinstance(a, complex) or (isinstance(a, float) and not a.is_integer()) or a < 0:
+            raise ValueError("Exception")
+
+        n = int(a)
+        memo = MathLib.fact_memo
+        result = memo.get(n)
+        if result is not None:
+            return result
+
+        # Continue from the greatest memoized factorial when it saves at least a third of the work,
+        # otherwise the divide and conquer algorithm of math.factorial is faster
+        start = max((k for k in memo if k < n), default=None)
+        if start is not None and 3 * start >= 2 * n:
+            result = memo[start] * _rangeProduct(start + 1, n)
+        else:
+            result = math.factorial(n)
+
+        budget = MathLib.fact_memo_budget * 8
+        if n >= MathLib.fact_memo_min and result.bit_length() <= budget:
+            memo[n] = result
+            bits = sum(value.bit_length() for value in memo.values())
+            while bits > budget:
+                # The smallest factorial is the cheapest to compute again
+                bits -= memo.pop(min(memo)).bit_length()
+
+        return result
+
+    @staticmethod
+    def root(x, n):
+        """! A function for making root
+        Float base is computed in floating point, math.sqrt for square root. Natural int base with integral exponent
+        gives exact int for perfect powers, large ones are computed by integer Newton iteration, so they do not
+        overflow float.
+
+        @param x base root
+        @param n an exponent
+        @pre n is not 0
+        @pre x is number
+        @pre n is number
+        @return a root result, exact when x is a perfect power, int when it is out of range of float
+
+        """
+
+        # Can't divide by zero
+        if n == 0:
+            raise ValueError("Exception")
+
+        if x.__class__ is float:
+            if n == 2 and x >= 0:
+                # Correctly rounded, so exact for perfect squares
+                return math.sqrt(x)
+            result = x ** (1 / n)
+            if n > 0 and result.__class__ is float and x.is_integer() and _isIntegral(n):
+                # Perfect power is exact, e.g. 27 √ 3 is 3 and not 3.0000000000000004
+                r = round(result)
+                if r ** int(n) == x:
+                    return float(r)
+            return result
+        if x.__class__ is not int or x < 0 or not _isIntegral(n):
+            return x ** (1 / n)
+
+        # Integer root, perfect powers give exact int
+        k = int(abs(n))
+        if x < 1 << 53:
+            result = float(x) ** (1 / k)
+            r = round(result)
+            if r ** k == x:
+                result = r
+        else:
+            r = _integerRoot(x, k)
+            if r ** k == x:
+                result = r
+            elif x.bit_length() <= 1023:
+                result = float(x) ** (1 / k)
+            elif r.bit_length() > 53:
+                # The fraction part is below precision of float, roots out of range of float stay int
+                result = float(r) if r.bit_length() <= 1023 else r
+            else:
+                result = 2.0 ** (math.log2(x) / k)
+
+        return result if n > 0 else 1 / result
+
+    @staticmethod
+    def pow(x, n):
+        """! A function for making power
+
+        @param x base power
+        @param n an exponent
+        @pre x is number
+        @pre n is natural integer
+        @return a power result
+
+        """
+
+        if isinstance(n, complex) or (isinstance(n, float) and not n.is_integer()) or n < 0:
+            raise ValueError("Exception")
+
+        # Changed after profiling, but it has actually worse timing than the original one
+        # result = 1
+        # for i in range(0, int(n)):
+        #     result *= x
+        #
+        # return result
+        return x ** n
+
+    @staticmethod
+    def powmod(x, n, m):
+        """! A function for making power reduced by modulo, the same as mod(pow(x, n), m)
+        Integral operands are reduced as you go by three-argument pow in O(log n) multiplications of small numbers,
+        so the result is exact even when the power itself does not fit into float.
+
+        @param x base power
+        @param n an exponent
+        @param m a divisor
+        @pre n is natural integer
+        @pre m is not 0
+        @return a power reduced by modulo, float when any operand is float
+
+        """
+
+        if isinstance(n, complex) or (isinstance(n, float) and not n.is_integer()) or n < 0:
+            raise ValueError("Exception")
+        # Can't divide by zero
+        if m == 0:
+            raise ValueError("Exception")
+
+        if _isIntegral(x) and _isIntegral(m):
+            result = pow(int(x), int(n), int(m))
+            return float(result) if float in (type(x), type(n), type(m)) else result
+
+        return MathLib.mod(MathLib.pow(x, n), m)
+
+    @staticmethod
+    def factmod(a, m):
+        """! A function for making factorial reduced by modulo, the same as mod(fact(a), m)
+        Integral modulus is reduced as you go in O(min(a, m)) multiplications of small numbers.
+
+        @param a natural number for factorial
+        @param m a divisor
+        @pre a is natural integer
+        @pre m is not 0
+        @return a factorial reduced by modulo, float when the modulus is float
+
+        """
+
+        if isinstance(a, complex) or (isinstance(a, float) and not a.is_integer()) or a < 0:
+            raise ValueError("Exception")
+        # Can't divide by zero
+        if m == 0:
+            raise ValueError("Exception")
+
+        if _isIntegral(m):
+            result = _factorialMod(int(a), int(m))
+            return float(result) if type(m) is float else result
+
+        return MathLib.mod(MathLib.fact(a), m)
+
+    @staticmethod
+    def tokenize(equation, number=float, tokens=None):
+        """! A function for splitting the math problem into tokens in a single pass
+        Members do not have to be separated by space, e.g. '5*(3+6)/15' or '-2e-3*x'. A sign directly followed by
+        a number where an operand is expected belongs to the number, other unary minus is operator '~'.
+        @param equation string with math problem
+        @param number function converting number literal, raising ValueError for other text
+        @param tokens list of tokens preceding the equation, new tokens are appended to it
+        @return list of tokens, numbers are converted by number, variables are Variable instances and the rest are
+        Token instances
+        """
+
+        if tokens is None:
+            tokens = []
+        append = tokens.append
+        get = MathLib.tokens.get
+        expecting = _EXPECTING.get
+        following = _FOLLOWING.get
+        signs = {'+', '-', '~'}
+        expect = not tokens or (tokens[-1].__class__ is Token and tokens[-1][0] < Token.POSTFIX)
+        for chunk in equation.split():
+            # Fast path for members separated by space, signs are resolved by whether an operand is expected
+            entry = expecting(chunk) if expect else following(chunk)
+            if entry is not None:
+                append(entry[0])
+                expect = entry[1]
+                continue
+            if expect or chunk[0] not in '+-':
+                try:
+                    append(number(chunk))
+                    expect = False
+                    continue
+                except ValueError:
+                    pass
+            for lexeme in _LEXEME.findall(chunk):
+                # The same fast path for members glued together
+                token = get(lexeme)
+                if token is None and lexeme[0] in '0123456789.':
+                    append(number(lexeme))
+                elif token is None or lexeme in signs:
+                    _lex(lexeme, tokens, number)
+                else:
+                    append(token)
+            expect = not tokens or (tokens[-1].__class__ is Token and tokens[-1][0] < Token.POSTFIX)
+
+        return tokens
+
+    @staticmethod
+    def parse(equation, number=float):
+        """! A function for parsing
+        @param equation string with math problem
+        @param number function converting number literal, raising ValueError for other text
+        @pre equation is entered correctly
+        @return postfix notation of equation in list, numbers are converted by number and variables are Variable
+        instances
+        """
+
+        s = []
+        postfix = []
+        _shunt(MathLib.tokenize(equation, number), s, postfix)
+        while s:
+            postfix.append(s.pop()[1])
+
+        return postfix
+
+    @staticmethod
+    def compile(equation, optimize=True, backend=None):
+        """! A function for compiling the math problem into a reusable program
+        Compiled programs are kept in MathLib.cache, so repeated math problems are parsed only once.
+        @param equation string with math problem
+        @param optimize whether constant subexpressions are folded and identical ones evaluated once
+        @param backend name from MathLib.backends or numeric backend itself, float MathLib by default
+        @pre equation is entered correctly
+        @return compiled program
+        """
+
+        lib = MathLib.backends[backend] if isinstance(backend, str) else backend or MathLib
+        expression = " ".join(equation.split())
+        key = (expression, optimize, lib)
+        program = MathLib.cache.get(key)
+        if program is None:
+            instrumentation = MathLib.instrumentation
+            if instrumentation is None:
+                program = Program(expression, MathLib.parse(expression, lib.number), optimize, lib)
+            else:
+                start = time.perf_counter()
+                postfix = MathLib.parse(expression, lib.number)
+                parsed = time.perf_counter()
+                program = Program(expression, postfix, optimize, lib)
+                instrumentation.record('parse', parsed - start)
+                instrumentation.record('compile', time.perf_counter() - parsed)
+            MathLib.cache.put(key, program)
+
+        return program
+
+    @staticmethod
+    def to_function(equation, cache=None):
+        """! A function for compiling the math problem into a native Python function
+        Operators and their guards are inlined, so evaluation does not dispatch per token. Code of the function is
+        marshalled into the cache directory, the warm start only loads it.
+        @param equation string with math problem
+        @param cache directory of the on-disk cache, MathLib.function_cache by default, it must be trusted
+        @pre equation is entered correctly
+        @return function taking values of variables in order of their first appearance, or as keywords,
+        integral floats are not converted
+        """
+
+        expression = " ".join(equation.split())
+        cache = MathLib.function_cache if cache is None else cache
+        path = None
+        if cache is not None:
+            name = hashlib.sha256(expression.encode()).hexdigest()
+            path = os.path.join(cache, name + ".marshal")
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                if data.startswith(MAGIC_NUMBER):
+                    return types.FunctionType(marshal.loads(data[len(MAGIC_NUMBER):]), _FUNCTION_GLOBALS)
+            except (OSError, ValueError, EOFError, TypeError):
+                # Missing or damaged file is compiled again
+                pass
+
+        code = _functionCode(MathLib.compile(expression))
+        if path is not None:
+            os.makedirs(cache, exist_ok=True)
+            temporary = "%s.%d" % (path, os.getpid())
+            with open(temporary, "wb") as f:
+                f.write(MAGIC_NUMBER + marshal.dumps(code))
+            os.replace(temporary, path)
+
+        return types.FunctionType(code, _FUNCTION_GLOBALS)
+
+    @staticmethod
+    def solve(equation, backend=None):
+        """! A function for solving the math problem
+        @param equation string with math problem
+        @param backend name from MathLib.backends or numeric backend itself, float MathLib by default
+        @pre equation is entered correctly
+        @return result of equation, integral float is converted to int
+        """
+
+        instrumentation = MathLib.instrumentation
+        if instrumentation is not None:
+            start = time.perf_counter()
+        if MathLib.result_cache is None:
+            result = MathLib.compile(equation, backend=backend).run()
+        else:
+            result = MathLib.cached(MathLib.compile(equation, backend=backend))
+        if isinstance(result, float) and result.is_integer():
+            result = int(result)
+        if instrumentation is not None:
+            instrumentation.record('solve', time.perf_counter() - start)
+
+        return result
+
+    @staticmethod
+    def cached(program):
+        """! Evaluates program through MathLib.result_cache, expensive results are stored
+        @param program compiled math problem without variables
+        @return result of the program, integral floats are not converted
+        """
+
+        cache = MathLib.result_cache
+        key = cache.key(program)
+        if key is None:
+            # Results of the backend cannot be told apart across processes
+            return program.run()
+        found, result = cache.get(key)
+        if found:
+            return result
+
+        start = time.perf_counter()
+        result = program.run()
+        cache.put(key, result, time.perf_counter() - start)
+
+        return result
+
+    @staticmethod
+    def estimate(equation):
+        """! A function for estimating cost of solving the math problem without solving it
+        Only magnitudes of intermediate results are tracked in floating point, so the estimate takes O(tokens)
+        and no big integer arithmetic. Variables are assumed to be small numbers.
+        @param equation string with math problem or its postfix notation
+        @pre equation is entered correctly
+        @return CostEstimate with total seconds, bytes of big integer results and nodes of operators ! ^ √
+        """
+
+        nodes = []
+        seconds = 0.0
+        size = 0.0
+        # Stack of (log10 of absolute value, approximate value or None when it is too large, is integer, pair of
+        # CostNode and approximate exponent or argument of power or factorial reduced by modulo later)
+        s = [(-math.inf, 0.0, False, None)]
+        for x in MathLib.parse(equation) if isinstance(equation, str) else equation:
+            seconds += MathLib.cost_per_token
+            if isinstance(x, Variable):
+                s.append((0.0, 1.0, False, None))
+                continue
+            if x not in MathLib.operands:
+                s.append((math.log10(abs(x)) if x else -math.inf, float(x), isinstance(x, int), None))
+                continue
+
+            b = s.pop()
+            a = None if x in MathLib.unary else s.pop()
+            lg, value, isInt = _estimateOperator(x, a, b)
+            digits = _estimateDigits(lg)
+
+            if x == '%' and a[3] is not None:
+                # Fused with power or factorial, see MathLib.powmod and MathLib.factmod
+                node, n = a[3]
+                n = math.inf if n is None else max(n, 0)
+                # Intermediate results are reduced, so they have at most as many digits as the modulus
+                width = min(node.digits, _estimateDigits(b[0]))
+                if node.operator == '^':
+                    # Square and multiply, numbers below the modulus are not reduced and grow like the power
+                    steps = 2 * math.log2(n + 1)
+                    cost = steps * MathLib.cost_per_token
+                    if width > 1:
+                        cost += node.seconds if width == node.digits else \
+                            steps * MathLib.cost_coefficients['*'] * width ** MathLib.cost_exponent
+                else:
+                    # One multiplication by a small factor and reduction per factor
+                    steps = min(n, abs(b[1] or math.inf))
+                    cost = steps * (MathLib.cost_per_token + MathLib.cost_per_digit * width)
+                seconds += cost - node.seconds
+                if node.seconds:
+                    size -= node.bytes
+                nodes[nodes.index(node)] = CostNode(node.operator + '%', digits, cost, 0)
+                s.append((lg, value, isInt, None))
+                continue
+
+            cost = 0.0
+            if isInt and x in MathLib.cost_coefficients and (x == '!' or (a[2] and b[2])):
+                cost = MathLib.cost_coefficients[x] * digits ** MathLib.cost_exponent
+                size += digits * math.log2(10) / 8
+            seconds += cost
+            fused = None
+            if x in ('!', '^', '√'):
+                nodes.append(CostNode(x, digits, cost, digits * math.log2(10) / 8 if isInt else 0))
+                if x != '√':
+                    fused = (nodes[-1], b[1])
+            s.append((lg, value, isInt, fused))
+
+        return CostEstimate(seconds, size, _estimateDigits(s[-1][0]), nodes)
+
+    @staticmethod
+    def digits(x):
+        """! A function for counting decimal digits of integer without converting it
+        @param x integer
+        @return number of digits of x without sign, one more when x is just below a huge power of ten
+        """
+
+        x = abs(x)
+        if x.bit_length() <= _STR_BITS:
+            return len(str(x))
+
+        return _leadingDigits(x, 1)[1] + 1
+
+    @staticmethod
+    def format_result(value, max_digits=30, precision=10):
+        """! A function for formatting result for display
+        Integers with more than max_digits digits are shown in scientific notation, their leading digits are computed
+        from logarithm of leading bits, so even huge results are formatted at once.
+        @param value result of the math problem
+        @param max_digits the longest integer shown as a whole
+        @param precision number of significant digits in scientific notation
+        @return text of the result
+        """
+
+        if value.__class__ is Fraction:
+            # str of Fraction refuses the same huge integers as str of int
+            return MathLib.to_decimal_string(value.numerator) + "/" + MathLib.to_decimal_string(value.denominator)
+        if value.__class__ is not int or value.bit_length() <= _STR_BITS and len(str(abs(value))) <= max_digits:
+            return str(value)
+
+        mantissa, exponent = _leadingDigits(abs(value), precision)
+        if exponent < max_digits:
+            return MathLib.to_decimal_string(value)
+
+        return "%s%s.%se+%d" % ("-" if value < 0 else "", mantissa[0], mantissa[1:], exponent)
+
+    @staticmethod
+    def to_decimal_string(x):
+        """! A function for converting integer of any size to decimal digits
+        Halves of the integer are converted recursively and joined by multiplication of decimal numbers, which is
+        subquadratic, while str of int is quadratic and refuses integers over sys.get_int_max_str_digits.
+        @param x integer
+        @return decimal digits of x, with minus sign for negative x
+        """
+
+        if x.bit_length() <= _STR_BITS:
+            return str(x)
+
+        with decimal.localcontext() as context:
+            context.prec = decimal.MAX_PREC
+            context.Emax = decimal.MAX_EMAX
+            context.Emin = decimal.MIN_EMIN
+            context.traps[decimal.Inexact] = True
+            text = str(_decimalOf(abs(x), x.bit_length(), {}))
+
+        return "-" + text if x < 0 else text
+
+    @staticmethod
+    def solve_batch(equations, workers=None, chunksize=256, backend=None):
+        """! A function for solving many math problems on all cores
+        Math problems are sent to worker processes in chunks and results are yielded in input order as soon as
+        they are ready. Only a bounded number of chunks is in flight, so the input may be an endless stream.
+        None in equations sends the math problems read so far, even an incomplete chunk, and yields all their results
+        before reading further, e.g. before waiting for slowly arriving input.
+        Every result is pickled exactly once in the worker (big integers in their binary form).
+        @param equations iterable of strings with math problems, None is not a math problem
+        @param workers number of worker processes, all cores by default, 1 solves in this process
+        @param chunksize number of math problems sent to a worker at once
+        @param backend name from MathLib.backends, float MathLib by default
+        @return generator of BatchResult, a failing math problem gives result with the exception in error
+        """
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        equations = iter(equations)
+
+        if workers <= 1:
+            for equation in equations:
+                if equation is not None:
+                    yield BatchResult(*_solveItem(equation, backend))
+            return
+
+        executor = ProcessPoolExecutor(workers)
+        try:
+            pending = deque()
+            exhausted = False
+            while True:
+                flush = False
+                while len(pending) < 2 * workers and not (flush or exhausted):
+                    chunk = []
+                    for equation in equations:
+                        if equation is None:
+                            flush = True
+                            break
+                        chunk.append(equation)
+                        if len(chunk) >= chunksize:
+                            break
+                    else:
+                        exhausted = True
+                    if chunk:
+                        pending.append(executor.submit(_solveChunk, chunk, backend))
+                if not pending and exhausted:
+                    break
+                while pending:
+                    for result in pending.popleft().result():
+                        yield BatchResult(*result)
+                    if not flush:
+                        break
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    @staticmethod
+    def evaluate(equation, **columns):
+        """! A function for evaluating the math problem with variables over whole NumPy arrays at once
+        @param equation string with math problem, e.g. 'x * 2 + y ^ 3'
+        @param columns values of variables, arrays (or numbers) broadcastable against each other
+        @pre equation is entered correctly
+        @pre all variables of equation are given
+        @return float64 array with results
+        """
+
+        if np is None:
+            raise ImportError("MathLib.evaluate requires numpy")
+
+        columns = {name: np.asarray(column, dtype=np.float64) for name, column in columns.items()}
+        result = np.asarray(MathLib.compile(equation, backend=ArrayMath).run(columns), dtype=np.float64)
+        shape = np.broadcast_shapes(*(column.shape for column in columns.values()))
+        if result.shape != shape:
+            result = np.array(np.broadcast_to(result, shape))
+
+        return result
+
+
+class NativeMath(MathLib):
+    """! MathLib computing in native numbers, integer literals are exact int and the other literals are float """
+
+    """! class variable - Name of the backend """
+    name = "native"
+
+    @staticmethod
+    def number(text):
+        """! Converts integer literal to int and other literal to float """
+
+        try:
+            return int(text)
+        except ValueError:
+            return float(text)
+
+
+class TokenBuffer:
+    """! Text of math problem with its tokens and parser state kept after every whitespace separated chunk.
+    When the text is edited, only chunks from the first changed one are tokenized and parsed again, so a preview of
+    the result can be updated after every keystroke.
+    """
+
+    def __init__(self, text="", number=float):
+        """! Constructor of the buffer
+        @param text initial text of math problem
+        @param number function converting number literal, raising ValueError for other text
+        """
+
+        self.number = number
+        self.text = ""
+        self.tokens = []
+        self.postfix = []
+        self.stack = []
+        # Ends of parsed chunks in text, and number of tokens, operator stack and length of postfix after each of them
+        self.ends = []
+        self.states = []
+        self.error = None
+        self.set_text(text)
+
+    def set_text(self, text):
+        """! Replaces text of the buffer, chunks before the first change and its preceding space are kept
+        @param text new text of math problem
+        @return number of chunks tokenized and parsed again
+        """
+
+        if text == self.text:
+            return 0
+
+        # A chunk is kept when the space after it is not changed
+        keep = bisect.bisect_left(self.ends, _commonPrefix(self.text, text))
+        del self.ends[keep:]
+        del self.states[keep:]
+        end = self.ends[-1] if self.ends else 0
+        count, stack, length = self.states[-1] if self.states else (0, (), 0)
+        del self.tokens[count:]
+        del self.postfix[length:]
+        self.stack = list(stack)
+        self.text = text
+        self.error = None
+
+        parsed = 0
+        for chunk in _CHUNK.finditer(text, end):
+            parsed += 1
+            try:
+                MathLib.tokenize(chunk.group(), self.number, self.tokens)
+                _shunt(self.tokens[count:], self.stack, self.postfix)
+            except (ValueError, IndexError):
+                # Incorrect math problem, the rest is parsed again after the next change
+                self.error = ValueError("Exception")
+                break
+            count = len(self.tokens)
+            self.ends.append(chunk.end())
+            self.states.append((count, tuple(self.stack), len(self.postfix)))
+
+        return parsed
+
+    def depth(self):
+        """! Returns number of opening brackets without closing ones """
+
+        return sum(1 for x in self.stack if x[0] == Token.LEFT)
+
+    def complete(self):
+        """! Checks whether the math problem can be solved, brackets are closed and the last operand is complete
+        @return True when the text is a complete math problem
+        """
+
+        if self.error is not None or not self.tokens or self.depth():
+            return False
+
+        last = self.tokens[-1]
+        return last.__class__ is not Token or last.kind >= Token.POSTFIX
+
+    def to_postfix(self):
+        """! Returns postfix notation of the whole text
+        @pre the text is a complete math problem
+        @return postfix notation like MathLib.parse
+        """
+
+        if self.error is not None:
+            raise self.error
+
+        return self.postfix + [x[1] for x in reversed(self.stack)]
+
+    def preview(self, max_seconds=0.01):
+        """! Solves the math problem when it is complete and cheap
+        @param max_seconds math problems estimated to take longer are not solved
+        @return result like MathLib.solve, None when the math problem is incomplete, expensive or incorrect
+        """
+
+        if not self.complete():
+            return None
+
+        postfix = self.to_postfix()
+        try:
+            if MathLib.estimate(postfix).seconds > max_seconds:
+                return None
+            result = _evaluatePostfix(postfix, MathLib)
+        except Exception:
+            return None
+        if isinstance(result, float) and result.is_integer():
+            result = int(result)
+
+        return result
+
+
+MathLib.backends.update({'float': MathLib, 'native': NativeMath, 'fraction': FractionMath, 'decimal': DecimalMath()})
+if gmpy2 is not None:
+    MathLib.backends['gmpy2'] = GmpyMath
+
+"""! Integers with at most this many bits are converted to text by str, they have less than 4300 digits """
+_STR_BITS = 10000
+
+"""! Regular expression of whitespace separated chunks of TokenBuffer """
+_CHUNK = re.compile(r'\S+')
+
+"""! Regular expression of numbers with optional sign and exponent, identifiers and other characters """
+_LEXEME = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|[^\W\d]\w*|\S')
+
+"""! Tokens by lexeme where an operand is expected with whether an operand is expected after them, '-' is unary
+minus and '+' or '~' are left to _lex """
+_EXPECTING = {lexeme: (token, token.kind < Token.POSTFIX) for lexeme, token in MathLib.tokens.items()
+              if lexeme not in ('+', '-', '~')}
+_EXPECTING['-'] = (MathLib.tokens['~'], True)
+
+"""! Tokens by lexeme after an operand with whether an operand is expected after them, '~' is left to _lex """
+_FOLLOWING = {lexeme: (token, token.kind < Token.POSTFIX) for lexeme, token in MathLib.tokens.items() if lexeme != '~'}
+
+
+def _commonPrefix(a, b):
+    """! Computes length of common prefix of two strings, slices are compared at once
+    @param a string
+    @param b string
+    @return length of the longest common prefix
+    """
+
+    if b.startswith(a):
+        return len(a)
+    if a.startswith(b):
+        return len(b)
+
+    # Binary search, the first differing position is in [lo, hi]
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        middle = (lo + hi + 1) // 2
+        if a[lo:middle] == b[lo:middle]:
+            lo = middle
+        else:
+            hi = middle - 1
+
+    return lo
+
+
+def _shunt(tokens, s, postfix):
+    """! Converts tokens to postfix notation by shunting yard for MathLib.parse and TokenBuffer
+    @param tokens tokens of the math problem
+    @param s stack of operators and brackets waiting for operands, it is kept for the following tokens
+    @param postfix list to which postfix notation is appended
+    @throws IndexError when a closing bracket has no opening one
+    """
+
+    append = postfix.append
+    push = s.append
+    pop = s.pop
+    token, prefix, left, right = Token, Token.PREFIX, Token.LEFT, Token.RIGHT
+    for x in tokens:
+        if x.__class__ is not token:
+            append(x)
+            continue
+
+        kind = x[0]
+        if kind == right:
+            while s[-1][0] != left:
+                append(pop()[1])
+            pop()
+        elif kind == left or kind == prefix:
+            # Opening bracket or prefix operator waits for its operand
+            push(x)
+        else:
+            # Opening bracket has the lowest priority, so it stops popping
+            priority = x[2]
+            while s and s[-1][2] >= priority:
+                append(pop()[1])
+            push(x)
+
+
+def _lex(lexeme, tokens, number=float):
+    """! Appends token of one lexeme for MathLib.tokenize, signs are resolved by the previous token
+    @param lexeme number, identifier or operator
+    @param tokens list of tokens
+    @param number function converting number literal
+    """
+
+    # An operand is expected at the beginning, after an opening bracket and after a binary or prefix operator
+    prefix = not tokens or (tokens[-1].__class__ is Token and tokens[-1].kind < Token.POSTFIX)
+    token = MathLib.tokens.get(lexeme)
+    if token is not None:
+        if prefix and (lexeme == '-' or lexeme == '+'):
+            # Unary plus does nothing
+            if lexeme == '-':
+                tokens.append(MathLib.tokens['~'])
+        elif token.kind == Token.PREFIX and not prefix:
+            raise ValueError("Exception")
+        else:
+            tokens.append(token)
+        return
+
+    if lexeme[0] in '+-' and not prefix:
+        # Binary operator glued to a number, e.g. 3-5
+        tokens.append(MathLib.tokens[lexeme[0]])
+        lexeme = lexeme[1:]
+
+    try:
+        tokens.append(number(lexeme))
+    except ValueError:
+        # Keywords such as None cannot name arguments of functions from MathLib.to_function
+        if not lexeme.isidentifier() or keyword.iskeyword(lexeme):
+            raise
+        tokens.append(Variable(lexeme))
+
+
+def _estimateOperator(x, a, b):
+    """! Estimates magnitude of operator result for MathLib.estimate
+    @param x operator
+    @param a estimate of the first operand, None for unary operators
+    @param b estimate of the last operand
+    @return tuple of log10 of absolute value, approximate value or None and whether result is integer
+    """
+
+    if x == '~':
+        return b[0], -b[1] if b[1] is not None else None, b[2]
+
+    if x == '!':
+        n = b[1]
+        if n is None:
+            return math.inf, None, True
+        lg = math.lgamma(max(n, 0) + 1) / math.log(10)
+        return lg, math.gamma(n + 1) if 0 <= n < 170 else None, True
+
+    isInt = a[2] and b[2] and x not in ('/', '√')
+    value = None
+    if a[1] is not None and b[1] is not None:
+        try:
+            value = float(getattr(MathLib, MathLib.functions[x])(a[1], b[1]))
+        except (ArithmeticError, ValueError, TypeError):
+            value = None
+    if value is not None and value == value and abs(value) != math.inf:
+        return (math.log10(abs(value)) if value else -math.inf), value, isInt
+
+    if x in ('+', '-'):
+        lg = max(a[0], b[0])
+    elif x == '*':
+        lg = a[0] + b[0]
+    elif x == '/':
+        lg = a[0] - b[0]
+    elif x == '%':
+        lg = min(a[0], b[0])
+    elif x == '^':
+        lg = a[0] * b[1] if b[1] is not None and b[1] > 0 else math.inf
+    else:
+        lg = a[0] / b[1] if b[1] else a[0]
+
+    return lg, None, isInt
+
+
+def _estimateDigits(lg):
+    """! Converts estimated log10 of absolute value to number of digits for MathLib.estimate
+    @param lg log10 of absolute value, -inf for zero, nan when magnitude is unknown
+    @return number of digits, at least 1, inf for unknown or too large magnitude
+    """
+
+    if lg == -math.inf:
+        return 1
+    if not lg < math.inf:
+        return math.inf
+
+    return max(math.floor(lg) + 1, 1)
+
+
+def _constantEstimate(value):
+    """! Estimates magnitude of constant like MathLib.estimate does for number literals
+    @param value number
+    @return tuple of log10 of absolute value, approximate value or None and whether it is integer
+    """
+
+    try:
+        lg = math.log10(abs(value)) if value else -math.inf
+    except (TypeError, ValueError, OverflowError):
+        return math.inf, None, False
+
+    return lg, float(value) if lg < 300 and not isinstance(value, complex) else None, isinstance(value, int)
+
+
+def _isIntegral(x):
+    """! Checks whether number is int or integral float
+    @param x number
+    @return True for int or integral float
+    """
+
+    return type(x) is int or (type(x) is float and x.is_integer())
+
+
+def _integerRoot(x, n):
+    """! Computes integer root by Newton iteration, square root by math.isqrt.
+    The initial guess of a large root is the root of leading bits of x, so only one Newton step is done in full
+    precision. The guess of a small root is computed from logarithm.
+    @param x natural number
+    @param n positive integer
+    @return the largest integer r with r ^ n <= x
+    """
+
+    if x < 2 or n == 1:
+        return x
+    if n == 2:
+        return math.isqrt(x)
+    bits = x.bit_length()
+    if n >= bits:
+        return 1
+
+    m = n - 1
+    # Bits of the root known from leading bits of x, with guard bits for the error of the Newton step
+    h = bits // n // 2 - n.bit_length() - 8
+    if h < 16:
+        e = math.log2(x) / n
+        whole = int(e)
+        r = int(2.0 ** e) + 1 if whole < 53 else int(2.0 ** (e - whole + 52)) << (whole - 52)
+        # The first Newton step gets on or above the root for any positive guess
+        r = (m * r + x // r ** m) // n
+        while True:
+            t = (m * r + x // r ** m) // n
+            if t >= r:
+                return r
+            r = t
+
+    # The guess is above the root, one Newton step gets on or just above the root
+    r = (_integerRoot(x >> (n * h), n) + 1) << h
+    r = (m * r + x // r ** m) // n
+    while r ** n > x:
+        r -= 1
+
+    return r
+
+
+def _leadingDigits(x, precision):
+    """! Computes leading decimal digits of natural number from logarithm of its leading bits
+    @param x positive integer
+    @param precision number of digits
+    @return pair of string with rounded leading digits and exponent of the first digit
+    """
+
+    shift = max(x.bit_length() - 4 * precision - 64, 0)
+    context = decimal.Context(prec=precision + 20 + len(str(shift)))
+    lg = context.add(context.log10(decimal.Decimal(x >> shift)),
+                     context.multiply(shift, context.log10(decimal.Decimal(2))))
+    exponent = int(lg)
+    mantissa, _, e = format(context.power(10, lg - exponent), ".%de" % (precision - 1)).partition("e")
+
+    return mantissa.replace(".", ""), exponent + int(e)
+
+
+def _decimalOf(x, bits, powers):
+    """! Converts natural number to Decimal by halves for MathLib.to_decimal_string
+    @param x natural number
+    @param bits number of bits of x or more
+    @param powers dict of already computed powers of two by exponent
+    @pre context has maximal precision and exponent
+    @return Decimal equal to x
+    """
+
+    if bits <= _STR_BITS:
+        return decimal.Decimal(x)
+
+    half = bits >> 1
+    high = x >> half
+    power = powers.get(half)
+    if power is None:
+        power = powers[half] = decimal.Decimal(2) ** half
+    return _decimalOf(x - (high << half), half, powers) + _decimalOf(high, bits - half, powers) * power
+
+
+def _factorialMod(n, m):
+    """! Computes factorial reduced by modulo as you go
+    @param n natural number for factorial
+    @param m non-zero integer divisor
+    @return n! % m
+    """
+
+    if n >= abs(m):
+        # m divides n!
+        return 0
+
+    result = 1
+    for i in range(2, n + 1):
+        result = result * i % m
+
+    return result % m
+
+
+def _encodeResult(value):
+    """! Encodes result into compact binary form for ResultCache, integers are stored in binary, not in decimal
+    @param value result of math problem
+    @return bytes with type tag and value, None for unsupported type
+    """
+
+    if type(value) is int:
+        return b"i" + value.to_bytes((value.bit_length() + 8) // 8, "little", signed=True)
+    if type(value) is float:
+        return b"f" + struct.pack("<d", value)
+    if type(value) is complex:
+        return b"c" + struct.pack("<dd", value.real, value.imag)
+    if type(value) is Fraction:
+        numerator = _encodeResult(value.numerator)
+        return b"q" + struct.pack("<Q", len(numerator)) + numerator + _encodeResult(value.denominator)
+    if type(value) is decimal.Decimal:
+        # Decimal has decimal digits, its string is linear
+        return b"d" + str(value).encode()
+    if gmpy2 is not None and type(value) in (type(gmpy2.mpz(0)), type(gmpy2.mpfr(0))):
+        return b"g" + gmpy2.to_binary(value)
+
+    return None
+
+
+def _decodeResult(data):
+    """! Decodes result encoded by _encodeResult
+    @param data bytes with type tag and value
+    @return result of math problem
+    """
+
+    tag, data = data[:1], data[1:]
+    if tag == b"i":
+        return int.from_bytes(data, "little", signed=True)
+    if tag == b"f":
+        return struct.unpack("<d", data)[0]
+    if tag == b"c":
+        return complex(*struct.unpack("<dd", data))
+    if tag == b"q":
+        length = struct.unpack("<Q", data[:8])[0]
+        return Fraction(_decodeResult(data[8:8 + length]), _decodeResult(data[8 + length:]))
+    if tag == b"d":
+        return decimal.Decimal(data.decode())
+    if tag == b"g":
+        return gmpy2.from_binary(data)
+
+    raise ValueError("Exception")
+
+
+def _rangeProduct(lo, hi):
+    """! Multiplies all integers from lo to hi by binary splitting, so multiplied numbers have similar sizes
+    @param lo first factor
+    @param hi last factor
+    @return product of integers in range, 1 for an empty range
+    """
+
+    if hi - lo < 64:
+        return math.prod(range(lo, hi + 1))
+
+    mid = (lo + hi) // 2
+    return _rangeProduct(lo, mid) * _rangeProduct(mid + 1, hi)
+
+
+"""! Functions of operators of numeric backends used by _evaluatePostfix """
+_POSTFIX_TABLES = {}
+
+
+class _Deferred:
+    """! Power or factorial in direct evaluation, evaluated when its result is used by other operator than modulo """
+
+    __slots__ = ('operator', 'args')
+
+    def __init__(self, operator, args):
+        self.operator = operator
+        self.args = args
+
+
+def _evaluatePostfix(postfix, lib):
+    """! Evaluates postfix notation at once without building a program, for math problems solved only once.
+    Modulo of power or factorial is fused into MathLib.powmod or MathLib.factmod like in Program, so the results are
+    the same as results of MathLib.solve.
+    @param postfix postfix notation of the math problem
+    @param lib numeric backend
+    @return result of the math problem, integral floats are not converted
+    """
+
+    functions = _POSTFIX_TABLES.get(lib)
+    if functions is None:
+        functions = _POSTFIX_TABLES[lib] = {x: getattr(lib, name) for x, name in MathLib.functions.items()}
+    operands = MathLib.operands
+    s = [lib.number("0.0")]
+    push = s.append
+    pop = s.pop
+    for x in postfix:
+        if x.__class__ is Variable or x in operands and x not in functions:
+            # Unbound variable or unsupported operator
+            raise ValueError("Exception")
+        if x not in operands:
+            push(x)
+            continue
+
+        b = pop()
+        if b.__class__ is _Deferred:
+            b = functions[b.operator](*b.args)
+        if x == '!':
+            push(_Deferred(x, (b,)))
+            continue
+        if x == '~':
+            push(functions[x](b))
+            continue
+
+        a = pop()
+        if a.__class__ is _Deferred:
+            if x == '%':
+                push(functions[a.operator + x](*a.args, b))
+                continue
+            a = functions[a.operator](*a.args)
+        push(_Deferred(x, (a, b)) if x == '^' else functions[x](a, b))
+
+    result = s[-1]
+    if result.__class__ is _Deferred:
+        result = functions[result.operator](*result.args)
+
+    return result
+
+
+def _solveItem(equation, backend=None):
+    """! Solves one math problem for MathLib.solve_batch
+    Math problems of a batch are rarely repeated, so they are evaluated directly without compiling, unless they go
+    through the result cache or instrumentation.
+    @param equation string with math problem
+    @param backend name from MathLib.backends or None
+    @return pair of result and exception, one of them is None
+    """
+
+    try:
+        if MathLib.result_cache is not None or MathLib.instrumentation is not None:
+            return MathLib.solve(equation, backend), None
+        lib = MathLib.backends[backend] if isinstance(backend, str) else backend or MathLib
+        result = _evaluatePostfix(MathLib.parse(equation, lib.number), lib)
+        if isinstance(result, float) and result.is_integer():
+            result = int(result)
+        return result, None
+    except Exception as e:
+        return None, e
+
+
+def _solveChunk(equations, backend=None):
+    """! Solves chunk of math problems in a worker process of MathLib.solve_batch
+    @param equations list of strings with math problems
+    @param backend name from MathLib.backends or None
+    @return list of pairs of result and exception
+    """
+
+    return [_solveItem(equation, backend) for equation in equations]
+
+
+"""! Python expressions of operators used by MathLib.to_function, a and b are operands """
+_OPERATIONS = {'+': "a + b", '-': "a - b", '*': "a * b", '~': "-a", '/': "a / b", '%': "a % b", '√': "root(a, b)",
+               '^': "a ** b", '!': "factorial(int(a))", '^%': "powmod(a, b, c)", '!%': "factmod(a, b)"}
+
+"""! Conditions of invalid operands raising ValueError, the same as checks of MathLib functions """
+_GUARDS = {'/': "b == 0", '%': "b == 0", '√': "b == 0",
+           '^': "isinstance(b, complex) or isinstance(b, float) and not b.is_integer() or b < 0",
+           '!': "isinstance(a, complex) or isinstance(a, float) and not a.is_integer() or a < 0"}
+
+"""! Globals of functions from MathLib.to_function, names starting with dot cannot clash with variables """
+_FUNCTION_GLOBALS = {'.factorial': math.factorial, '.int': int, '.isinstance': isinstance, '.float': float,
+                     '.complex': complex, '.error': ValueError, '.powmod': MathLib.powmod, '.factmod': MathLib.factmod,
+                     '.root': MathLib.root}
+
+"""! Deeper nested expressions are split by temporaries, the compiler of Python is recursive """
+_MAX_NESTING = 64
+
+
+class _Substitution(ast.NodeTransformer):
+    """! Replaces names in a template of expression """
+
+    def __init__(self, names):
+        """! Constructor of the substitution
+        @param names dict of replacements, names missing in it are prefixed by dot
+        """
+
+        self.names = names
+
+    def visit_Name(self, node):
+        """! Replaces one name
+        @param node name node
+        @return replacement
+        """
+
+        replacement = self.names.get(node.id)
+        if replacement is None:
+            return ast.Name('.' + node.id, ast.Load())
+
+        return copy.copy(replacement)
+
+
+def _template(text, a, b=None, c=None):
+    """! Creates expression from template
+    @param text Python expression with operands a, b and c
+    @param a expression of the first operand
+    @param b expression of the second operand
+    @param c expression of the third operand
+    @return expression
+    """
+
+    return _Substitution({'a': a, 'b': b, 'c': c}).visit(ast.parse(text, mode="eval").body)
+
+
+def _functionCode(program):
+    """! Generates code object of function evaluating the program, see MathLib.to_function
+    Operands of a guarded operator are stored in temporaries, so the guard does not evaluate them twice, and all
+    pending operands are stored before a guard, so errors are raised in the same order as by Program.run.
+    @param program compiled math problem
+    @return code object
+    """
+
+    body = []
+    s = []
+    shared = {}
+
+    def temporary(expression):
+        name = ".t%d" % len(body)
+        body.append(ast.Assign([ast.Name(name, ast.Store())], expression))
+        return ast.Name(name, ast.Load())
+
+    # Iterative post-order traversal, stack holds pairs of expression and its nesting
+    stack = [(program.tree, False)]
+    while stack:
+        node, ready = stack.pop()
+        if not ready:
+            if node in shared:
+                s.append((ast.Name(shared[node], ast.Load()), 0))
+            elif node.operator is None:
+                s.append((ast.Name(str(node.value), ast.Load()) if isinstance(node.value, Variable)
+                          else ast.Constant(node.value), 0))
+            else:
+                stack.append((node, True))
+                stack.extend((arg, False) for arg in reversed(node.args))
+            continue
+
+        x = node.operator
+        if x in _GUARDS:
+            s[:] = [(temporary(expression) if nesting else expression, 0) for expression, nesting in s]
+        operands = s[len(s) - len(node.args):]
+        del s[len(s) - len(node.args):]
+        a, b = operands[0][0], operands[-1][0]
+
+        if x in _GUARDS:
+            checked = b if x != '!' else a
+            if not isinstance(checked, ast.Constant) or _guardFails(x, checked.value):
+                error = ast.Call(ast.Name('.error', ast.Load()), [ast.Constant("Exception")], [])
+                body.append(ast.If(_template(_GUARDS[x], a, b), [ast.Raise(error, None)], []))
+
+        expression = _template(_OPERATIONS[x], *(expression for expression, _ in operands))
+        nesting = max(nesting for _, nesting in operands) + 1
+        if nesting > _MAX_NESTING or (node.uses > 1 and node not in shared):
+            expression = temporary(expression)
+            nesting = 0
+            if node.uses > 1:
+                shared[node] = expression.id
+        s.append((expression, nesting))
+
+    function = ast.parse("def expression(): pass").body[0]
+    function.args.args = [ast.arg(str(x)) for x in program.variables]
+    function.body = body + [ast.Return(s[0][0])]
+    module = ast.fix_missing_locations(ast.Module([function], []))
+
+    return next(c for c in compile(module, "<expression>", "exec").co_consts if isinstance(c, types.CodeType))
+
+
+def _guardFails(x, value):
+    """! Checks a constant operand of guarded operator
+    @param x operator
+    @param value constant operand
+    @return True when the operator raises an error, also when the check itself fails
+    """
+
+    try:
+        if x in ('!', '^'):
+            return isinstance(value, complex) or (isinstance(value, float) and not value.is_integer()) or value < 0
+        return value == 0
+    except TypeError:
+        # The guard is kept, so the error is raised when the function runs like with Program.run
+        return True
 
-        s = [0.0]
-        for x in MathLib.parse(equation):
-            if x not in MathLib.operands:
-                s.append(x)
-            else:
-                b = s.pop()
-                if x == '+':
-                    s.append(MathLib.add(s.pop(), b))
-                elif x == '-':
-                    s.append(MathLib.sub(s.pop(), b))
-                elif x == '*':
-                    s.append(MathLib.mul(s.pop(), b))
-                elif x == '/':
-                    s.append(MathLib.div(s.pop(), b))
-                elif x == '%':
-                    s.append(MathLib.mod(s.pop(), b))
-                elif x == '√':
-                    s.append(MathLib.root(s.pop(), b))
-                elif x == '^':
-                    s.append(MathLib.pow(s.pop(), b))
-                elif x == '!':
-                    s.append(MathLib.fact(b))
-                else:
-                    raise ValueError("Exception")
 
-        if isinstance(s[-1], float) and s[-1].is_integer():
-            return int(s[-1])
+if os.environ.get("MATHLIB_RESULT_CACHE"):
+    MathLib.result_cache = ResultCache(os.environ["MATHLIB_RESULT_CACHE"])
 
-        return s[-1]
+if os.environ.get("MATHLIB_INSTRUMENT"):
+    MathLib.instrumentation = Instrumentation()
+    atexit.register(MathLib.instrumentation.save, os.environ["MATHLIB_INSTRUMENT"])
 
 """ End of file mathlib.py """
@@ -19,8 +19,21 @@
 
 """
 
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
-from mathlib import MathLib as m
+import deviation
+from calccli import solveFiles
+from calcserver import CalcServer
+from decimal import Decimal
+from fractions import Fraction
+from mathlib import MathLib as m, DecimalMath, ExpressionCache, Instrumentation, ResultCache, RunningStats, \
+    TokenBuffer, Variable, np
 
 
 class MathLibTests(unittest.TestCase):
@@ -73,6 +86,33 @@ class MathLibTests(unittest.TestCase):
             m.fact(-845)  # Not a natural number
         with self.assertRaises(Exception):
             m.fact(2.5)  # Not a natural number
+        self.assertEqual(3628800, m.fact(10.0))
+
+    def test_fact_memo(self):
+        """! A memoized factorial testing """
+        m.fact_memo.clear()
+        expected = 1
+        for i in range(2, 3001):
+            expected *= i
+        self.assertEqual(expected // (3000 * 2999), m.fact(2998))
+        self.assertIn(2998, m.fact_memo)
+        self.assertEqual(expected, m.fact(3000))  # Continues from 2998 !
+        self.assertEqual(expected, m.fact(3000))
+        m.fact_memo.clear()
+
+        # Memo is bounded by size of factorials, the smallest ones are evicted
+        budget = m.fact_memo_budget
+        m.fact_memo_budget = (m.fact(5000).bit_length() + m.fact(4000).bit_length()) // 8 + 1
+        m.fact_memo.clear()
+        try:
+            for n in (3000, 4000, 5000):
+                m.fact(n)
+            self.assertEqual([4000, 5000], sorted(m.fact_memo))
+            m.fact(20000)  # Bigger than the whole budget
+            self.assertNotIn(20000, m.fact_memo)
+        finally:
+            m.fact_memo_budget = budget
+            m.fact_memo.clear()
 
     def test_root(self):
         """! A root testing """
@@ -81,6 +121,12 @@ class MathLibTests(unittest.TestCase):
         self.assertEqual(20, m.root(20, 1))
         self.assertEqual(0.5, m.root(0.25, 2))
         self.assertEqual(0.5, m.root(8, -3))
+        self.assertEqual(3, m.root(27.0, 3))
+        self.assertEqual(10 ** 200, m.root(10 ** 600, 3))
+        self.assertEqual(10 ** 500 - 1, m.root(10 ** 1500 - 1, 3))
+        self.assertAlmostEqual(1e200, m.root(10 ** 400 + 1, 2))
+        self.assertAlmostEqual(369.49166347196, m.root(m.fact(1000), 1000))
+        self.assertEqual(Fraction(2, 3), m.solve("( 8 / 27 ) √ 3", "fraction"))
         with self.assertRaises(Exception):
             m.root(545, 0)
 
@@ -107,6 +153,589 @@ class MathLibTests(unittest.TestCase):
         with self.assertRaises(Exception):
             m.mod(5454, 0)  # Can't divide by zero
 
+    def test_solve(self):
+        """! A math problem solving testing """
+        self.assertEqual(3, m.solve("5 * ( 3 + 6 ) / 15"))
+        self.assertEqual(-2, m.solve("- 5 + 3"))
+        self.assertEqual(8, m.solve("2 + 3 !"))
+        self.assertEqual(2.5, m.solve("5 / 2"))
+        self.assertEqual(0, m.solve(""))
+        with self.assertRaises(Exception):
+            m.solve("1 / 0")  # Can't divide by zero
+        with self.assertRaises(Exception):
+            m.solve("1 = 1")  # Unsupported operator
+
+    def test_tokenize(self):
+        """! A lexer testing """
+        self.assertEqual([5.0, m.tokens['*'], m.tokens['('], 3.0, m.tokens['+'], 6.0, m.tokens[')'], m.tokens['/'],
+                          15.0], m.tokenize("5*(3+6)/15"))
+        self.assertEqual(m.tokenize("5 * ( 3 + 6 ) / 15"), m.tokenize("5*(3+6)/15"))
+        self.assertEqual([2.0, m.tokens['*'], -0.005], m.tokenize("2*-5e-3"))
+        self.assertEqual([3.0, m.tokens['-'], 5.0], m.tokenize("3-5"))
+        self.assertEqual([m.tokens['~'], Variable("x")], m.tokenize("-x"))
+        with self.assertRaises(Exception):
+            m.tokenize("5 $ 3")  # Unknown character
+        with self.assertRaises(Exception):
+            m.tokenize("5 ~ 3")  # Unary minus without operand
+
+    def test_unary_minus(self):
+        """! An unary minus solving testing """
+        self.assertEqual(3, m.solve("5*(3+6)/15"))
+        self.assertEqual(-25, m.solve("- 5 ^ 2"))
+        self.assertEqual(25, m.solve("-5 ^ 2"))  # Sign belongs to the number
+        self.assertEqual(-10, m.solve("2 * - 5"))
+        self.assertEqual(5, m.solve("2--3"))
+        self.assertEqual(-25, m.solve("-(2+3)^2"))
+        self.assertEqual(-120, m.solve("- 5 !"))
+
+    def test_compile(self):
+        """! A compiled program cache testing """
+        cache = m.cache
+        m.cache = ExpressionCache(2)
+        try:
+            program = m.compile("1 + 2")
+            self.assertIs(program, m.compile("  1   +  2 "))
+            self.assertEqual(3, program.run())
+            self.assertEqual({'hits': 1, 'misses': 1, 'evictions': 0, 'size': 1}, m.cache.stats())
+            m.solve("2 * 3")
+            m.solve("2 ^ 3")
+            self.assertEqual(1, m.cache.evictions)
+            self.assertIsNot(program, m.compile("1 + 2"))
+        finally:
+            m.cache = cache
+
+    def test_optimize(self):
+        """! Constant folding and shared subexpressions testing """
+        program = m.compile("( 2 + 3 ) * x + ( x * 1 ) / ( x * 1 )")
+        self.assertEqual("+\n  *\n    5.0\n    Variable('x')\n  /\n    *  #1\n      Variable('x')\n      1.0\n    #1",
+                         program.dump())
+        self.assertEqual(11, program.run({"x": 2}))
+        self.assertEqual("1.0", m.compile("( 3 ! ) / ( 3 ! )").dump())
+        self.assertEqual("Variable('x')", m.compile("~ ~ x").dump())
+        self.assertEqual("+\n  2.0\n  3.0", m.compile("2 + 3", optimize=False).dump())
+        program = m.compile("x + 1 / 0")
+        self.assertIn("/", program.dump())  # Error is raised when the program runs
+        with self.assertRaises(Exception):
+            program.run({"x": 1})
+
+    def test_variables(self):
+        """! A math problem with variables testing """
+        self.assertEqual([Variable("x"), 2.0, '*', Variable("y"), 3.0, '^', '+'], m.parse("x * 2 + y ^ 3"))
+        program = m.compile("x * 2 + y ^ 3")
+        self.assertEqual(("x", "y"), program.variables)
+        self.assertEqual(10, program.run({"x": 1, "y": 2}))
+        with self.assertRaises(Exception):
+            m.solve("x + 1")  # Unbound variable
+
+    def test_to_function(self):
+        """! A native function of math problem testing """
+        function = m.to_function("x * 2 + ( y + 1 ) ^ 3 / ( y + 1 )")
+        self.assertEqual(6, function(1, 1))
+        self.assertEqual(12, function(y=2, x=1.5))
+        for equation, x in (("x / 0", 1), ("x ^ 0.5", 2), ("( x - 1 ) !", 0), ("x ! + 1", 2.5), ("1 √ ( x - 1 )", 1),
+                            ("( 2 √ x ) !", -3), ("x + ( -3 √ 2 ) !", 1), ("x % 0 + 2 ^ ( -3 √ 2 )", 1)):
+            with self.assertRaises(ValueError):
+                m.to_function(equation)(x)
+            with self.assertRaises(ValueError):
+                m.compile(equation).run({"x": x})
+        for equation in ("None + 1", "x * True", "lambda"):
+            with self.assertRaises(ValueError):
+                m.parse(equation)
+
+        with tempfile.TemporaryDirectory() as cache:
+            self.assertEqual(6, m.to_function("x !", cache)(3))
+            self.assertEqual(1, len(os.listdir(cache)))
+            self.assertEqual(24, m.to_function("x  !", cache)(4))
+
+    def test_backends(self):
+        """! Numeric backends testing """
+        self.assertEqual(2 ** 100 + 1, m.solve("2 ^ 100 + 1", "native"))
+        self.assertIsInstance(m.solve("3 ! * 2", "native"), int)
+        self.assertEqual(Fraction(1, 1), m.solve("( 1 / 3 ) * 3", "fraction"))
+        self.assertEqual(Fraction(-1, 2), m.solve("7.5 % -2", "fraction"))
+        self.assertEqual(Decimal("0.3"), m.solve("0.1 + 0.2", "decimal"))
+        self.assertEqual(Decimal("2"), m.solve("-7 % 3", "decimal"))
+        self.assertEqual(Decimal("0.33333"), m.solve("1 / 3", DecimalMath(5)))
+        program = m.compile("x * 2", backend="decimal")
+        self.assertEqual(Decimal("0.2"), program.run({"x": Decimal("0.1")}))
+        self.assertIsNot(program, m.compile("x * 2"))
+        for backend in ("native", "fraction", "decimal"):
+            for equation in ("1 / 0", "2 ^ 0.5", "( 0 - 2 ) !", "4 % 0"):
+                with self.assertRaises(ValueError):
+                    m.solve(equation, backend)
+
+    def test_modular(self):
+        """! Power and factorial reduced by modulo testing """
+        self.assertEqual(4, m.solve("3 ^ 1000 % 7"))  # 3 ^ 1000 does not fit into float
+        self.assertEqual(pow(3, 10 ** 20, 10 ** 9 + 7), m.solve("3 ^ 100000000000000000000 % 1000000007", "native"))
+        self.assertEqual(-2, m.solve("-3 ^ 3 % -5", "native"))
+        self.assertEqual(1, m.solve("5 ! % 7"))
+        self.assertEqual(0, m.solve("100000000 ! % 99991", "native"))
+        self.assertEqual(5040 % -11, m.solve("7 ! % -11", "native"))
+        self.assertEqual(1.625, m.solve("2.5 ^ 3 % 2"))
+        self.assertIn("^%", m.compile("x ^ 3 % 5").dump())
+        self.assertEqual(4, m.compile("x ^ 3 % 5").run({"x": 4}))
+        self.assertEqual(4, m.to_function("x ^ y % 7")(3, 1000))
+        for equation in ("3 ^ 0.5 % 7", "3 ^ 2 % 0", "-1 ! % 3", "x ! % 0"):
+            with self.assertRaises(ValueError):
+                m.compile(equation).run({"x": 3})
+
+    def test_result_cache(self):
+        """! A persistent result cache testing """
+        with tempfile.TemporaryDirectory() as directory:
+            m.result_cache = cache = ResultCache(os.path.join(directory, "results.db"), budget=4000, min_seconds=0)
+            try:
+                self.assertEqual(2 ** 10000 + 1, m.solve("2 ^ 10000 + 1", "native"))
+                self.assertEqual(2 ** 10000 + 1, m.solve(" 2^10000+1", "native"))
+                self.assertEqual(Fraction(1, 3), m.solve("1 / 3", "fraction"))
+                self.assertEqual(1 / 3, m.solve("1 / 3"))
+                self.assertEqual((1, 3, 0), (cache.hits, cache.misses, cache.evictions))
+                m.solve("3 ^ 10000", "native")
+                m.solve("5 ^ 10000", "native")
+                stats = cache.stats()
+                self.assertGreater(stats['evictions'], 0)
+                self.assertLessEqual(stats['bytes'], 4000)
+                self.assertEqual((False, None), cache.get(b"missing"))
+
+                # Backends are told apart by name and settings, not by identity of the object
+                key = cache.key(m.compile("1 / 3", backend="decimal"))
+                self.assertEqual(key, cache.key(m.compile("1 / 3", backend=DecimalMath(28))))
+                self.assertNotEqual(key, cache.key(m.compile("1 / 3", backend=DecimalMath(50))))
+                self.assertNotEqual(cache.key(m.compile("1 / 3")), cache.key(m.compile("1 / 3", backend="native")))
+                self.assertEqual(Decimal("0.33333"), m.solve("1 / 3", DecimalMath(5)))
+                self.assertEqual(Decimal(1) / Decimal(3), m.solve("1 / 3", DecimalMath(28)))
+            finally:
+                m.result_cache = None
+                cache.connection().close()
+
+    def test_instrumentation(self):
+        """! Statistics of operators and phases testing """
+        program = m.compile("x ! * 2 + x / 0")
+        with Instrumentation() as instrumentation:
+            self.assertIs(instrumentation, m.instrumentation)
+            with self.assertRaises(ValueError):
+                program.run({"x": 30})
+            m.solve("2 + 3 ! * 2")
+        self.assertIsNone(m.instrumentation)
+
+        operators = instrumentation.operators
+        self.assertEqual((2, 1, 108), (operators['fact'].calls, operators['fact'].bigints, operators['fact'].max_bits))
+        self.assertEqual((0, 1), (operators['div'].calls, operators['div'].errors))
+        self.assertEqual((1, 1), (instrumentation.phases['solve'].calls, operators['add'].calls))
+        self.assertIn('mathlib_operator_calls_total{operator="fact"} 2\n', instrumentation.to_prometheus())
+        with self.assertRaises(ValueError):
+            program.run({"x": 1})
+        self.assertEqual((2, 1), (operators['fact'].calls, operators['div'].errors))
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_evaluate(self):
+        """! A vectorized evaluation testing """
+        x = np.arange(5.0)
+        self.assertEqual([1.0, 3.0, 5.0, 7.0, 9.0], m.evaluate("x * 2 + y ^ 3", x=x, y=1).tolist())
+        self.assertEqual([1.0, 1.0, 2.0, 6.0, 24.0], m.evaluate("x !", x=x).tolist())
+        self.assertEqual([3.0, 3.0], m.evaluate("1 + 2", x=[0, 1]).tolist())
+        self.assertEqual([2.0, 0.5], m.evaluate("x √ 2", x=[4, 0.25]).tolist())
+        self.assertTrue(np.isinf(m.evaluate("x !", x=[171])[0]))
+        # Constants overflow to infinity like arrays do
+        self.assertEqual([float('inf'), -float('inf')], m.evaluate("x * ( 200 ! )", x=[1.0, -2.0]).tolist())
+        self.assertEqual([6.0, 12.0], m.evaluate("x * ( 3 ! )", x=[1, 2]).tolist())
+        with self.assertRaises(Exception):
+            m.evaluate("1 / x", x=x)  # Can't divide by zero
+        with self.assertRaises(Exception):
+            m.evaluate("2 ^ x", x=[1, 1.5])  # 1.5 is float exponent, not natural
+        with self.assertRaises(Exception):
+            m.evaluate("x !", x=[-1])  # Not a natural number
+        with self.assertRaises(Exception):
+            m.evaluate("x + y", x=x)  # Unbound variable
+
+    def test_estimate(self):
+        """! A cost estimation testing """
+        cost = m.estimate("1 + 2")
+        self.assertLess(cost.seconds, 1e-3)
+        self.assertEqual(1, cost.digits)
+        self.assertEqual([], cost.nodes)
+        cost = m.estimate("( 1000000 ! ) * 2")
+        self.assertEqual(5565710, cost.digits)
+        self.assertEqual(['!'], [node.operator for node in cost.nodes])
+        self.assertGreater(cost.seconds, 1)
+        self.assertGreater(cost.bytes, 2e6)
+        self.assertEqual(float('inf'), m.estimate("( 1000 ! ) !").digits)
+        for equation in ("1 - 1", "2 * 0", "5 % 5", "0 ^ 5", "( 1 - 1 ) !"):
+            cost = m.estimate(equation)
+            self.assertEqual(1, cost.digits)
+            self.assertLess(cost.seconds, 1e-3)
+        self.assertGreater(m.estimate("( 1 - 1 ) + 1000000 !").seconds, 1)
+        # Reduced factorial multiplies numbers as big as the modulus
+        self.assertLess(m.estimate("( 20000 ! ) % 7").seconds, 1e-3)
+        self.assertGreater(m.estimate("( 20000 ! ) % ( 19000 ! )").seconds, 0.05)
+        self.assertGreater(m.estimate("( 3 ^ 1000000 ) % ( 19000 ! )").seconds, 0.05)
+
+    def test_format_result(self):
+        """! Formatting of results testing """
+        self.assertEqual("4.023872601e+2567", m.format_result(m.fact(1000)))
+        self.assertEqual("-4.02e+2567", m.format_result(-m.fact(1000), precision=3))
+        self.assertEqual("1.000000000e+40", m.format_result(10 ** 40 - 1))
+        self.assertEqual("123456", m.format_result(123456))
+        self.assertEqual("2.5", m.format_result(2.5))
+        self.assertEqual(m.to_decimal_string(m.fact(2000)), m.format_result(m.fact(2000), 10000))
+        self.assertEqual("1/" + m.to_decimal_string(m.fact(2000)), m.format_result(Fraction(1, m.fact(2000))))
+        self.assertEqual(2568, m.digits(m.fact(1000)))
+        self.assertEqual(1, m.digits(0))
+        self.assertEqual("6" + "9" * 6000, m.to_decimal_string(7 * 10 ** 6000 - 1))
+        self.assertEqual("-1" + "0" * 4999 + "12345", m.to_decimal_string(-(10 ** 5004 + 12345)))
+        self.assertEqual("-42", m.to_decimal_string(-42))
+
+    def test_token_buffer(self):
+        """! An incremental parsing testing """
+        buffer = TokenBuffer()
+        text = ""
+        for char in "( 12 + 3 ) * 4 ! - 2 ^ 3 % 5":
+            text += char
+            self.assertLessEqual(buffer.set_text(text), 1)
+        self.assertEqual(m.parse(text), buffer.to_postfix())
+        self.assertEqual(m.solve(text), buffer.preview())
+        self.assertEqual(1, buffer.set_text(text[:-1] + "6"))
+        self.assertEqual(m.solve(text[:-1] + "6"), buffer.preview())
+        self.assertEqual(13, buffer.set_text(text.replace("12", "10")))
+
+        buffer.set_text("( 1 + ( 2")
+        self.assertEqual(2, buffer.depth())
+        self.assertFalse(buffer.complete())
+        self.assertIsNone(buffer.preview())
+        buffer.set_text("1 + 2 )")
+        self.assertIsNotNone(buffer.error)
+        self.assertIsNone(buffer.preview())
+        buffer.set_text("100000 !")
+        self.assertIsNone(buffer.preview())
+        buffer.set_text("1e5 % 7")
+        self.assertEqual(5, buffer.preview())
+        buffer.set_text("3 - 3")
+        self.assertEqual(0, buffer.preview())
+        buffer.set_text("( 5 % 5 ) * 2 + 1")
+        self.assertEqual(1, buffer.preview())
+
+    def test_solve_batch(self):
+        """! A parallel solving testing """
+        equations = ["%d ! / %d" % (i, i) for i in range(1, 50)] + ["10 ^ 400 % 7", "( 2 + 3 ) ! % 7", "~ 2 ^ 3 - 1",
+                                                                    "x + 1", "1 / 0", "2 ^ 200"]
+        for workers in (1, 2):
+            results = list(m.solve_batch(equations, workers=workers, chunksize=8))
+            self.assertEqual([m.solve(e) for e in equations[:-3]], [r.value for r in results[:-3]])
+            self.assertEqual([4, 1, -9], [r.value for r in results[-6:-3]])
+            self.assertIsNone(results[0].error)
+            self.assertIsNone(results[-2].value)
+            self.assertIsInstance(results[-3].error, ValueError)
+            self.assertIsInstance(results[-2].error, ValueError)
+            self.assertEqual(2 ** 200, results[-1].value)
+            results = m.solve_batch(["1 / 3", "1 + 6"], workers, backend="fraction")
+            self.assertEqual([Fraction(1, 3), 7], [r.value for r in results])
+
+
+class RunningStatsTests(unittest.TestCase):
+    """! Tests for running mean and standard deviation"""
+
+    def test_push(self):
+        """! A one by one summary testing """
+        stats = RunningStats()
+        for x in (2, 4, 4, 4, 5, 5, 7, 9):
+            stats.push(x)
+        self.assertEqual(8, stats.n)
+        self.assertAlmostEqual(5, stats.mean)
+        self.assertAlmostEqual(32 / 7, stats.variance)
+        self.assertAlmostEqual((32 / 7) ** 0.5, stats.stdev)
+        with self.assertRaises(Exception):
+            RunningStats().mean  # No values
+        with self.assertRaises(Exception):
+            stats = RunningStats()
+            stats.push(1)
+            stats.variance  # One value
+
+    def test_precision(self):
+        """! A large mean precision testing """
+        stats = RunningStats()
+        for x in (4, 7, 13, 16):
+            stats.push(1e9 + x)
+        self.assertAlmostEqual(30, stats.variance, places=6)
+
+    def test_merge(self):
+        """! A merging of summaries testing """
+        values = [1e9 + x for x in (4, 7, 13, 16, 1, 2, 30)]
+        stats = RunningStats()
+        stats.push_many(values[:3])
+        other = RunningStats()
+        other.push_many(values[3:])
+        self.assertIs(stats, stats.merge(other).merge(RunningStats()))
+        whole = RunningStats()
+        for x in values:
+            whole.push(x)
+        self.assertEqual(7, stats.n)
+        self.assertAlmostEqual(whole.mean, stats.mean)
+        self.assertAlmostEqual(whole.variance, stats.variance, places=6)
+
+
+class DeviationTests(unittest.TestCase):
+    """! Tests for standard deviation of files"""
+
+    values = [1e9 + x for x in (4, 7, 13, 16, 1, 2, 30, -5.5, 0.25)] * 7
+
+    def assertStatsEqual(self, expected, stats):
+        """! Checks that summaries are equal up to rounding
+        @param expected RunningStats of the same values summed one by one
+        @param stats tested RunningStats
+        """
+
+        self.assertEqual(expected.n, stats.n)
+        self.assertAlmostEqual(expected.mean, stats.mean, places=4)
+        self.assertAlmostEqual(expected.variance, stats.variance, places=4)
+
+    def expected(self):
+        """! Returns summary of the test values added one by one """
+
+        stats = RunningStats()
+        for x in self.values:
+            stats.push(x)
+        return stats
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_chunked(self):
+        """! Numbers split by the end of a block are carried over to the next block """
+        text = " \n".join(repr(x) for x in self.values).encode()
+        for blockSize in (1, 5, 13, len(text), 1 << 20):
+            self.assertStatsEqual(self.expected(), deviation.statsChunked(io.BytesIO(text), blockSize))
+        self.assertEqual(0, deviation.statsChunked(io.BytesIO(b"  \n")).n)
+        with self.assertRaises(ValueError):
+            deviation.statsChunked(io.BytesIO(b"1 2 x 3"))
+
+    def test_shards(self):
+        """! Shards start on whitespace and the result does not depend on the number of workers """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "values.txt")
+            text = "\n".join(" ".join(repr(x) for x in self.values[i:i + 4]) for i in range(0, len(self.values), 4))
+            with open(path, "w") as f:
+                f.write(text)
+            bounds = deviation.shardBounds(path, 40)
+            self.assertGreater(len(bounds), 2)
+            self.assertEqual(0, bounds[0][0])
+            self.assertEqual(len(text), bounds[-1][1])
+            for (_, end), (start, _) in zip(bounds, bounds[1:]):
+                self.assertEqual(end, start)
+                self.assertTrue(text[start].isspace())
+
+            one = deviation.statsFile(path, workers=1, shardSize=40)
+            self.assertStatsEqual(self.expected(), one)
+            for workers in (2, 3):
+                stats = deviation.statsFile(path, workers=workers, shardSize=40)
+                self.assertEqual((one.n, one.mean, one.variance), (stats.n, stats.mean, stats.variance))
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_binary(self):
+        """! Raw and npy files are detected and memory-mapped """
+        with tempfile.TemporaryDirectory() as directory:
+            raw = os.path.join(directory, "values.f64")
+            np.asarray(self.values, dtype="<f8").tofile(raw)
+            npy = os.path.join(directory, "values.npy")
+            np.save(npy, np.asfortranarray(np.reshape(self.values, (9, 7))))
+            text = os.path.join(directory, "values.txt")
+            with open(text, "w") as f:
+                f.write("1 2 3")
+            self.assertEqual(('raw', 'npy', 'text'), tuple(map(deviation.fileFormat, (raw, npy, text))))
+
+            values = deviation.mapValues(npy, 'npy')
+            self.assertEqual((len(self.values),), values.shape)
+            # A view of the mapping, not a copy in memory
+            self.assertIsNotNone(values.filename)
+            self.assertEqual(len(self.values), len(deviation.mapValues(raw, 'raw')))
+
+            for path in (raw, npy):
+                one = deviation.statsFile(path, workers=1, shardSize=80)
+                self.assertStatsEqual(self.expected(), one)
+                stats = deviation.statsFile(path, workers=2, shardSize=80)
+                self.assertEqual((one.n, one.mean, one.variance), (stats.n, stats.mean, stats.variance))
+
+            with open(raw, "ab") as f:
+                f.write(b"\0")
+            with self.assertRaises(ValueError):
+                deviation.mapValues(raw, 'raw')
+
+
+class CalcServerTests(unittest.TestCase):
+    """! Tests for local calculation service"""
+
+    @staticmethod
+    def request(expression, backend=None, timeout=None):
+        """! Creates POST /solve request
+        @param expression string with math problem
+        @param backend name from MathLib.backends or None
+        @param timeout seconds for solving or None
+        @return bytes of the request
+        """
+
+        body = {'expression': expression}
+        if backend is not None:
+            body['backend'] = backend
+        if timeout is not None:
+            body['timeout'] = timeout
+        body = json.dumps(body).encode()
+        return b"POST /solve HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body
+
+    @staticmethod
+    async def response(reader):
+        """! Reads one response
+        @param reader stream of the connection
+        @return pair of HTTP status and decoded JSON body
+        """
+
+        head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        length = next(int(line.split(":")[1]) for line in head if line.lower().startswith("content-length:"))
+        return int(head[0].split(" ")[1]), json.loads(await reader.readexactly(length))
+
+    def run_server(self, test, **options):
+        """! Runs coroutine against a server listening on a free port
+        @param test coroutine function called with the server and its port
+        @param options arguments of CalcServer
+        """
+
+        async def main():
+            server = CalcServer(**options)
+            started = asyncio.get_running_loop().create_future()
+            task = asyncio.create_task(server.serve(port=0, started=started.set_result))
+            port = (await started).sockets[0].getsockname()[1]
+            try:
+                await test(server, port)
+                while server.connections:
+                    await asyncio.sleep(0.01)
+            finally:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+        asyncio.run(main())
+
+    def test_pipelining(self):
+        """! Responses of pipelined requests are sent in order of requests """
+
+        async def test(server, port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            # The first one is solved in a worker, the following ones at once
+            writer.write(self.request("2 ^ 100", "native") + self.request("1 + 2") + self.request("1 / 0")
+                         + b"GET /metrics HTTP/1.1\r\n\r\n")
+            self.assertEqual((200, {'result': 2 ** 100, 'type': 'int'}), await self.response(reader))
+            self.assertEqual((200, {'result': 3, 'type': 'int'}), await self.response(reader))
+            self.assertEqual(422, (await self.response(reader))[0])
+            status, metrics = await self.response(reader)
+            self.assertEqual(200, status)
+            self.assertEqual(4, metrics['requests'])
+            self.assertEqual(1, metrics['connections'])
+            writer.close()
+
+        self.run_server(test, workers=1)
+
+    def test_overload_and_timeout(self):
+        """! Full queue gives 503, timeout gives 504 and replaces the worker """
+
+        async def test(server, port):
+            slow = await asyncio.open_connection("127.0.0.1", port)
+            slow[1].write(self.request("3 ^ 30000000", "native", 0.5))
+            while server.pool is None or not server.pool.busy():
+                await asyncio.sleep(0.01)
+            process = server.pool.workers[0].process
+
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(self.request("2 ^ 10", "native") + self.request("2 ^ 11", "native"))
+            self.assertEqual(504, (await self.response(slow[0]))[0])
+            self.assertEqual((200, {'result': 1024, 'type': 'int'}), await self.response(reader))
+            self.assertEqual(503, (await self.response(reader))[0])
+            self.assertFalse(process.is_alive())
+            self.assertEqual(1, len(server.pool.workers))
+            self.assertIsNot(process, server.pool.workers[0].process)
+
+            writer.write(b"GET /metrics HTTP/1.1\r\n\r\n")
+            status, metrics = await self.response(reader)
+            self.assertEqual((1, 1, 1, 0), (metrics['timeouts'], metrics['rejected'], metrics['solved'],
+                                            metrics['queue_depth']))
+            self.assertEqual(1, metrics['latency']['pool']['count'])
+            writer.close()
+            slow[1].close()
+
+        self.run_server(test, workers=1, queueSize=1)
+
+    def test_dead_worker(self):
+        """! Dead worker gives 502 and is replaced, the following requests are solved """
+
+        async def test(server, port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(self.request("3 ^ 30000000", "native"))
+            while server.pool is None or not server.pool.busy():
+                await asyncio.sleep(0.01)
+            server.pool.workers[0].process.kill()
+            writer.write(self.request("2 ^ 10", "native") + self.request("1 + 2"))
+            self.assertEqual(502, (await self.response(reader))[0])
+            self.assertEqual((200, {'result': 1024, 'type': 'int'}), await self.response(reader))
+            self.assertEqual((200, {'result': 3, 'type': 'int'}), await self.response(reader))
+
+            # A worker killed while idle is replaced before it gets a math problem
+            server.pool.workers[0].process.kill()
+            server.pool.workers[0].process.join()
+            writer.write(self.request("2 ^ 11", "native") + self.request("2 ^ 12", "native"))
+            self.assertEqual((200, {'result': 2048, 'type': 'int'}), await self.response(reader))
+            self.assertEqual((200, {'result': 4096, 'type': 'int'}), await self.response(reader))
+            self.assertEqual(1, server.counters['worker_failures'])
+            self.assertEqual(1, len(server.pool.workers))
+
+            # An unexpected error of one request does not stall the pipeline
+            server.metrics = lambda: 1 / 0
+            writer.write(b"GET /metrics HTTP/1.1\r\n\r\n" + self.request("1 + 2"))
+            self.assertEqual(500, (await self.response(reader))[0])
+            self.assertEqual((200, {'result': 3, 'type': 'int'}), await self.response(reader))
+            writer.close()
+
+        self.run_server(test, workers=1)
+
+
+class CalcCliTests(unittest.TestCase):
+    """! Tests for command line calculator"""
+
+    def test_solve_files(self):
+        """! Failing and undecodable lines give ERROR, the following ones are still solved """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "problems.txt")
+            with open(path, "wb") as f:
+                f.write(b"1 + 1\n2 ^ 100\n\xff\n\n1 / 0\n1 / 3\n")
+            for workers in (1, 2):
+                output, errors = io.StringIO(), io.StringIO()
+                self.assertEqual(2, solveFiles([path], output, errors, workers, backend="fraction"))
+                self.assertEqual("2\n%d\nERROR\n\nERROR\n1/3\n" % 2 ** 100, output.getvalue())
+                self.assertIn("problems.txt:3: UnicodeDecodeError", errors.getvalue())
+                self.assertIn("problems.txt:5: ", errors.getvalue())
+
+    @unittest.skipUnless(hasattr(os, "mkfifo"), "named pipes are not supported")
+    def test_slow_input(self):
+        """! Results of slowly arriving lines are written before the next line arrives, also with worker processes """
+        writer = ("import sys, threading\n"
+                  "with open(sys.argv[1], 'wb', buffering=0) as f:\n"
+                  "    f.write(b'1 + 1\\n')\n"
+                  "    reading = threading.Thread(target=sys.stdin.readline, daemon=True)\n"
+                  "    reading.start()\n"
+                  "    reading.join(30)\n"
+                  "    f.write(b'1 + 2\\n')\n")
+
+        class Output(io.StringIO):
+            def flush(self):
+                if self.getvalue() and not flushed:
+                    flushed.append(self.getvalue())
+                    process.stdin.write(b"\n")
+                    process.stdin.flush()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "problems")
+            os.mkfifo(path)
+            for workers in (1, 2):
+                flushed = []
+                with subprocess.Popen([sys.executable, "-c", writer, path], stdin=subprocess.PIPE) as process:
+                    output = Output()
+                    self.assertEqual(0, solveFiles([path], output, io.StringIO(), workers))
+                self.assertEqual(["2\n"], flushed)
+                self.assertEqual("2\n3\n", output.getvalue())
+
 
 if __name__ == '__main__':
     """! Entry point for running tests """